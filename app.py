@@ -2,131 +2,582 @@
 # Eine Web Applikation zum finden und erweitern von id3 und id3v2 Metadaten in MP3 Dateien.
 # Zum starten muss das venv geladen werden
 # Abhängigkeiten sind in der packages.lst definiert und können mit pip installiert werden
+# Start: python app.py (waitress, 16 Threads) - Entwicklungsserver mit FLASK_DEV=1 python app.py
 
 
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_from_directory, make_response
-from tagger.core import MusicTagger, group_by_directory
-from tagger.metadata_enrichment import enrich_multiple_files
-from tagger.audio_recognition import recognize_audio_file
-from tagger.fingerprinting import get_audio_fingerprint_metadata, AlbumRecognitionService
+from flask import Flask, render_template, stream_template, request, redirect, url_for, jsonify, send_file, Response
+from flask.json.provider import DefaultJSONProvider
+from flask_compress import Compress
+from werkzeug.middleware.proxy_fix import ProxyFix
+from tagger.core import get_music_tagger, group_by_directory, has_mp3_files, iter_mp3_files, is_mp3_filename, read_apic, sniff_image_mime
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Union
+from urllib.parse import quote
+from datetime import datetime, timezone
+from io import BytesIO
+from PIL import Image
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import hashlib
+import queue
 import os
+import stat
+import tempfile
+import threading
+import uuid
 import logging
+import orjson
+import msgspec
+import eyed3
+
+
+def _setup_queue_logging():
+    """Log-Ausgabe über einen Hintergrund-Thread - Request-Threads legen Einträge nur in eine Queue"""
+    root = logging.getLogger()
+    # LOG_LEVEL=WARNING im Betrieb: info/debug-Aufrufe pro Datei enden dann schon an der Level-Prüfung
+    level = os.getenv('LOG_LEVEL', 'INFO').upper()
+    root.setLevel(level if isinstance(logging.getLevelName(level), int) else logging.INFO)
+    queue_handler = QueueHandler(queue.SimpleQueue())
+    listener = QueueListener(queue_handler.queue, *root.handlers, respect_handler_level=True)
+    root.handlers = [queue_handler]
+    listener.start()
+    atexit.register(listener.stop)
+
+
+# Die tagger-Module haben beim Import bereits basicConfig ausgeführt
+_setup_queue_logging()
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON-Provider auf Basis von orjson - gilt für jsonify() und request.get_json()"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # jsonify(): orjson-Bytes direkt als Body, ohne Umweg über str und erneutes UTF-8-Encoding
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS),
+            mimetype=self.mimetype
+        )
+
+
+# eyed3-Warnungen zu ungewöhnlichen Frames einmalig stummschalten statt pro Cover-Request
+eyed3.log.setLevel("ERROR")
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+# Nur hinter nginx/Apache mit X-Sendfile-Unterstützung aktivieren
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', '').lower() in ('1', 'true')
+# nginx: interne Location (z.B. /protected-audio mit 'internal; alias /;') für X-Accel-Redirect
+X_ACCEL_PREFIX = os.getenv('X_ACCEL_PREFIX', '').rstrip('/')
+# Anzahl vorgeschalteter Proxys - X-Forwarded-* übernehmen, damit url_for (Location der Aufträge)
+# Schema und Host des Proxys verwendet statt http://127.0.0.1:5000
+TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', '0'))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES,
+                            x_host=TRUSTED_PROXIES, x_prefix=TRUSTED_PROXIES)
+
+# JSON/HTML/JS/CSS komprimiert ausliefern - gestreamte Seiten nicht, sonst würden sie gepuffert
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_MIN_SIZE'] = 512
+app.config['COMPRESS_STREAMS'] = False
+Compress(app)
+
+# Maximale Anzahl paralleler ID3-Schreibvorgänge in /process_files (über alle Aufträge) -
+# Schreiben ist I/O-gebunden, daher mehr Threads als Kerne, aber gedeckelt für HDDs/Netzlaufwerke
+WRITE_WORKERS = min(16, (os.cpu_count() or 1) * 2)
+# Anzahl gemerkter /process_files-Aufträge für die Status-Abfrage
+MAX_WRITE_JOBS = 100
+
+# Tag-Schreibvorgänge laufen im Hintergrund, der Request kehrt sofort mit einer job_id zurück
+_write_executor = ThreadPoolExecutor(max_workers=WRITE_WORKERS, thread_name_prefix='tag-write')
+_write_jobs = {}
+_write_jobs_lock = threading.Lock()
+
+# Audio-/Album-Erkennung wartet Sekunden auf Shazam/AcoustID - im Hintergrund statt auf dem Web-Thread
+RECOGNITION_WORKERS = 4
+MAX_RECOGNITION_JOBS = 100
+_recognition_executor = ThreadPoolExecutor(max_workers=RECOGNITION_WORKERS, thread_name_prefix='recognition')
+_recognition_jobs = {}
+_recognition_jobs_lock = threading.Lock()
+
+# Bestätigung geschriebener Tags braucht einen fpcalc-Lauf - nachgelagert auf einem eigenen
+# Einzel-Thread, damit Schreibaufträge nicht auf das Dekodieren warten
+_confirm_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tag-confirm')
+
+# Vorschaubilder bis zu dieser Größe werden im Speicher gehalten (256px-Thumbnails haben 10-30 KB,
+# 512px bis etwa 80 KB, größer sind nur nicht dekodierbare Originale) - höchstens COVER_CACHE_SIZE * 128 KB RAM
+COVER_CACHE_SIZE = 2048
+COVER_CACHE_MAX_BYTES = 128 * 1024
+_LARGE_COVER = object()
+
+# Vorschaubilder statt eingebetteter Cover in voller Auflösung - ?size= wird auf die nächste Stufe
+# aufgerundet, damit Cache und Browser nur wenige Varianten je Datei sehen (Detailansicht max. 200px)
+COVER_THUMB_SIZES = (128, 256, 512)
+COVER_THUMB_DEFAULT = 256
+# Einen Tag aus dem Browser-Cache, danach Revalidierung per ETag (304 ohne Body)
+COVER_CACHE_CONTROL = 'public, max-age=86400, must-revalidate'
+
+# nginx: Vorschaubilder aus COVER_CACHE_DIR über eine interne Location (X-Accel-Redirect) ausliefern
+COVER_CACHE_DIR = os.path.expanduser(os.getenv('COVER_CACHE_DIR', ''))
+COVER_ACCEL_PREFIX = os.getenv('COVER_ACCEL_PREFIX', '').rstrip('/')
+COVER_EXTENSIONS = {'image/webp': '.webp', 'image/jpeg': '.jpg', 'image/png': '.png', 'image/gif': '.gif'}
+if COVER_ACCEL_PREFIX and COVER_CACHE_DIR:
+    os.makedirs(COVER_CACHE_DIR, exist_ok=True)
+
+# Erlaubte Wurzelverzeichnisse für Dateizugriffe (MP3_ALLOWED_ROOTS, durch ':' getrennt)
+ALLOWED_ROOTS = tuple(
+    os.path.realpath(os.path.expanduser(root))
+    for root in os.getenv('MP3_ALLOWED_ROOTS', '/').split(os.pathsep) if root
+)
+
+
+# Request-Schemas: msgspec dekodiert und validiert den Body in einem Schritt direkt aus den Bytes
+class FilePathBody(msgspec.Struct):
+    """Body der Einzeldatei-Endpunkte"""
+    file_path: str
+
+
+class DirectoryBody(msgspec.Struct):
+    """Body von /recognize_album - ein Verzeichnis oder mehrere über directory_paths"""
+    directory_path: str = ''
+    directory_paths: List[str] = []
+
+
+class TagUpdate(msgspec.Struct):
+    """Ein Eintrag in /process_files - nur diese Felder werden an update_id3_tags weitergereicht"""
+    path: str
+    artist: Optional[str] = None
+    title: Optional[str] = None
+    album: Optional[str] = None
+    track: Optional[Union[str, int]] = None
+
+
+class ProcessFilesBody(msgspec.Struct):
+    """Body von /process_files"""
+    files: List[TagUpdate] = []
+
+
+def _safe_stat(path):
+    """Ein einziger stat-Aufruf: (stat_result, 'dir'|'file'|'other') oder (None, None)"""
+    try:
+        st = os.stat(path)
+    except (OSError, ValueError):
+        return None, None
+    
+    if stat.S_ISDIR(st.st_mode):
+        return st, 'dir'
+    if stat.S_ISREG(st.st_mode):
+        return st, 'file'
+    return st, 'other'
+
+
+def _within_allowed_roots(real_path):
+    """Liegt ein bereits aufgelöster Pfad unterhalb einer der erlaubten Wurzeln?"""
+    return any(os.path.commonpath((root, real_path)) == root for root in ALLOWED_ROOTS)
+
+
+def _is_allowed_path(path):
+    """Liegt der Pfad nach Auflösen aller Symlinks unterhalb der erlaubten Wurzeln?"""
+    # Ohne MP3_ALLOWED_ROOTS ist alles erlaubt - dann auch kein realpath (ein lstat je Pfadkomponente).
+    # Sonst bei jedem Aufruf neu auflösen: ein umgebogener Symlink darf keine alte Freigabe behalten
+    return ALLOWED_ROOTS == (os.sep,) or _within_allowed_roots(os.path.realpath(path))
+
+
+def _mp3_stat(path):
+    """stat_result einer regulären MP3-Datei innerhalb der erlaubten Wurzeln oder None"""
+    if not path or not is_mp3_filename(path) or not _is_allowed_path(path):
+        return None
+    st, kind = _safe_stat(path)
+    return st if kind == 'file' else None
+
+
+@lru_cache(maxsize=4096)
+def _absolute_path(name):
+    """Absoluter, normalisierter Pfad aus URL/Body - reine Zeichenkettenoperation, daher gecacht"""
+    return os.path.normpath(os.path.join('/', name))
+
+
+def _resolve_directory(directory):
+    """Aufgelöstes Verzeichnis für /process oder None außerhalb der erlaubten Wurzeln"""
+    # realpath und Wurzel-Prüfung pro Request - das Ergebnis hängt von Symlinks ab und wird nicht gecacht
+    path = os.path.realpath(_absolute_path(directory))
+    if not _within_allowed_roots(path):
+        return None
+    return path
+
+
+def _resolve_audio_path(filename):
+    """Aufgelöster Pfad für /static/audio oder None außerhalb der erlaubten Wurzeln"""
+    # Symlinks auflösen und gegen die erlaubten Wurzeln prüfen (kein Path-Traversal) - bei jedem
+    # Request, auch beim Spulen; Existenz und Typ prüft anschließend das stat in serve_audio
+    file_path = os.path.realpath(_absolute_path(filename))
+    if not is_mp3_filename(file_path) or not _within_allowed_roots(file_path):
+        return None
+    return file_path
+
+
+def _etag_fresh(etag):
+    """If-None-Match-Prüfung - Flask-Compress hängt komprimierten Antworten ':br'/':gzip' an das ETag"""
+    variants = [etag] + [f"{etag}:{algorithm}" for algorithm in app.config['COMPRESS_ALGORITHM']]
+    return any(request.if_none_match.contains(variant) for variant in variants)
+
+
+def _json(obj, status=200):
+    """Schnelle JSON-Antwort über orjson - Werte wie eyed3-Datumsobjekte werden als String ausgegeben"""
+    return Response(orjson.dumps(obj, default=str), status=status, mimetype='application/json')
+
+
+def _stream_enriched(stream, enrich):
+    """Reicht die gerenderte Seite durch - bricht der Browser ab, entfallen die noch wartenden Online-Suchen"""
+    try:
+        yield from stream
+    finally:
+        enrich.cancel()
+
+
+def _directory_stats(directory):
+    """Pfad -> (mtime_ns, Größe) aller MP3s eines Verzeichnisbaums"""
+    # Nur stat aus dem scandir-Eintrag, kein ID3-Parsing - ändert sich bei jedem Tag-Update
+    stats = {}
+    for entry in iter_mp3_files(directory, parallel=True):
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        stats[entry.path] = (st.st_mtime_ns, st.st_size)
+    return stats
+
+
+def _scan(directory):
+    """Scan-Ergebnis eines Verzeichnisses, gecacht solange sich keine MP3 ändert"""
+    return _cached_scan(directory, frozenset(_directory_stats(directory).items()))
+
+
+@lru_cache(maxsize=64)
+def _cached_scan(directory, stats_key):
+    """Scan-Ergebnis pro (Verzeichnis, Datei-Stats) - wiederholte Aufrufe ohne erneutes ID3-Parsing"""
+    # Die Stats aus dem Schlüssel ersetzen beim Cache-Miss den zweiten Verzeichnisdurchlauf
+    return get_music_tagger().scan_directory(directory, stats=dict(stats_key))
+
+
+@lru_cache(maxsize=1024)
+def _file_details_body(file_path, mtime_ns, size):
+    """Fertig serialisierte Details-Antwort pro (Pfad, mtime, Größe), None ohne Details"""
+    # Cache-Treffer liefern die Bytes direkt - kein erneutes orjson.dumps
+    details = _file_details(file_path, (mtime_ns, size))
+    if not details:
+        return None
+    return orjson.dumps({'success': True, 'details': details}, default=str)
+
+
+def _write_tags(file_info):
+    """Schreibt die Tags einer Datei - (Pfad, Erfolg), läuft auf dem Schreib-Pool"""
+    file_path = file_info.path
+    
+    # Fehlende Dateien meldet update_id3_tags selbst mit False - kein stat pro Datei vorab
+    if not is_mp3_filename(file_path) or not _is_allowed_path(file_path):
+        return file_path, False
+    
+    try:
+        # Aktualisiere ID3-Tags (unbekannte Keys hat das Schema bereits verworfen)
+        success = get_music_tagger().update_id3_tags(
+            file_path,
+            artist=file_info.artist,
+            title=file_info.title,
+            album=file_info.album,
+            track=file_info.track
+        )
+        if success and file_info.artist and file_info.title:
+            # Geschriebene Tags gelten als bestätigt - die erweiterte Suche überspringt dieses Audio künftig
+            from tagger.audio_recognition import get_recognition_service
+            _confirm_executor.submit(
+                get_recognition_service().confirm_metadata,
+                file_path, file_info.artist, file_info.title, file_info.album
+            )
+        return file_path, success
+    except Exception as e:
+        logging.error(f"Fehler bei Verarbeitung von {file_path}: {str(e)}")
+        return file_path, False
+
+def _finish_write(job, file_path, success):
+    """Trägt das Ergebnis eines Schreibvorgangs in seinen Auftrag ein"""
+    with _write_jobs_lock:
+        if success:
+            job['processed_count'] += 1
+        else:
+            job['errors'].append(file_path)
+        job['pending'] -= 1
+
+def _start_recognition(task, *args):
+    """Startet eine Erkennung auf dem Hintergrund-Pool - Antwort 202 mit job_id und Status-URL"""
+    job_id = uuid.uuid4().hex
+    future = _recognition_executor.submit(task, *args)
+    
+    with _recognition_jobs_lock:
+        _recognition_jobs[job_id] = future
+        # Nur die letzten Aufträge behalten, abgeschlossene zuerst verwerfen
+        while len(_recognition_jobs) > MAX_RECOGNITION_JOBS:
+            oldest = next((key for key, old in _recognition_jobs.items() if old.done()), None)
+            if oldest is None:
+                break
+            del _recognition_jobs[oldest]
+    
+    response = _json({'success': True, 'job_id': job_id}, status=202)
+    response.headers['Location'] = url_for('recognition_status', job_id=job_id)
+    return response
+
+def _recognize_audio_result(file_path):
+    """Antwort von /recognize_audio - läuft auf dem Erkennungs-Pool"""
+    try:
+        # Lazy Import: ShazamIO (samt aiohttp) erst beim ersten Erkennungsauftrag laden, nicht beim Start
+        from tagger.audio_recognition import recognize_audio_file
+        result = recognize_audio_file(file_path)
+        
+        if result:
+            return {
+                'success': True,
+                'result': {
+                    'artist': result.get('artist'),
+                    'title': result.get('title'),
+                    'album': result.get('album'),
+                    'service': result.get('service'),
+                    'confidence': result.get('confidence', 0)
+                }
+            }
+        return {'success': False, 'error': 'Keine Erkennung möglich'}
+    
+    except Exception as e:
+        logging.error(f"Audio-Erkennung fehlgeschlagen: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+def _album_files(directory_path):
+    """Datensätze der MP3s direkt im Album-Verzeichnis - Unterverzeichnisse gehören zu anderen Alben"""
+    paths = sorted(entry.path for entry in iter_mp3_files(directory_path, recursive=False))
+    # Track-Längen aus dem (meist schon warmen) Scan-Cache, ohne den Baum darunter zu lesen
+    return get_music_tagger().load_files(paths)
+
+def _recognize_album_result(directory_path):
+    """Antwort von /recognize_album - läuft auf dem Erkennungs-Pool"""
+    try:
+        from tagger.fingerprinting import get_album_recognition_service
+        files_data = _album_files(directory_path)
+        return get_album_recognition_service().recognize_album_from_directory(directory_path, files_data)
+    
+    except Exception as e:
+        logging.error(f"Album-Erkennung fehlgeschlagen: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+def _recognize_albums_result(directory_paths):
+    """Antwort von /recognize_album mit directory_paths - Verzeichnisse parallel, läuft auf dem Erkennungs-Pool"""
+    try:
+        from tagger.fingerprinting import get_album_recognition_service
+        files_data = {directory_path: _album_files(directory_path) for directory_path in directory_paths}
+        albums = get_album_recognition_service().recognize_albums_from_directories(directory_paths, files_data)
+        return {'success': True, 'albums': albums}
+    
+    except Exception as e:
+        logging.error(f"Album-Erkennung fehlgeschlagen: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+def _cover_cache_file(etag, cover):
+    """Dateiname des Vorschaubilds in COVER_CACHE_DIR - wird beim ersten Abruf atomar geschrieben"""
+    mime_type, cover_data = cover
+    name = etag + COVER_EXTENSIONS.get(mime_type, '')
+    path = os.path.join(COVER_CACHE_DIR, name)
+    if not os.path.exists(path):
+        # Über eine temporäre Datei, damit nginx nie ein halb geschriebenes Bild ausliefert
+        fd, tmp_path = tempfile.mkstemp(dir=COVER_CACHE_DIR, prefix='.cover-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(cover_data)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except OSError:
+            os.unlink(tmp_path)
+            raise
+    return name
+
+def _extract_cover(file_path):
+    """Erstes eingebettetes Cover als (mime_type, bytes) oder None"""
+    try:
+        # Nur das APIC-Frame lesen, alle übrigen Frames werden übersprungen
+        return read_apic(file_path)
+    except ValueError as e:
+        logging.debug(f"APIC-Schnellpfad nicht möglich für {file_path}: {str(e)}")
+    
+    # Fallback für Tag-Varianten, die nur eyed3 vollständig versteht
+    audiofile = eyed3.load(file_path)
+    if not (audiofile and audiofile.tag and audiofile.tag.images):
+        return None
+    
+    # Erstes Bild verwenden
+    image = audiofile.tag.images[0]
+    
+    # MIME-Type aus dem Tag, sonst aus der Dateisignatur
+    return image.mime_type or sniff_image_mime(image.image_data), image.image_data
+
+def _thumb_size(requested):
+    """Kleinste Stufe aus COVER_THUMB_SIZES, die mindestens der angefragten Kantenlänge entspricht"""
+    if not requested:
+        return COVER_THUMB_DEFAULT
+    return next((size for size in COVER_THUMB_SIZES if size >= requested), COVER_THUMB_SIZES[-1])
+
+def _cover_thumbnail(cover, webp, thumb_size):
+    """Verkleinert ein Cover auf thumb_size Pixel - als WebP oder (ohne Browser-Unterstützung) JPEG"""
+    mime_type, cover_data = cover
+    try:
+        img = Image.open(BytesIO(cover_data))
+        img.thumbnail((thumb_size, thumb_size), Image.Resampling.LANCZOS)
+        
+        buffer = BytesIO()
+        if webp:
+            img = img if img.mode in ('RGB', 'RGBA') else img.convert('RGBA')
+            img.save(buffer, format='WEBP', quality=80, method=6)
+            return 'image/webp', buffer.getvalue()
+        img.convert('RGB').save(buffer, format='JPEG', quality=85)
+        return 'image/jpeg', buffer.getvalue()
+    except Exception as e:
+        # Nicht dekodierbare Bilder unverändert ausliefern
+        logging.warning(f"Cover-Vorschau nicht erstellt: {str(e)}")
+        return cover
+
+def _load_cover_preview(file_path, webp, thumb_size):
+    """Eingebettetes Cover als Vorschaubild (mime_type, bytes) oder None"""
+    cover = _extract_cover(file_path)
+    return _cover_thumbnail(cover, webp, thumb_size) if cover else None
+
+@lru_cache(maxsize=COVER_CACHE_SIZE)
+def _cached_cover(file_path, mtime_ns, size, webp, thumb_size):
+    """Cover-Cache - mtime/Größe im Schlüssel verwerfen Einträge geänderter Dateien automatisch"""
+    cover = _load_cover_preview(file_path, webp, thumb_size)
+    if cover and len(cover[1]) > COVER_CACHE_MAX_BYTES:
+        # Große Cover nicht halten, nur eine Markierung bleibt im Cache
+        return _LARGE_COVER
+    return cover
+
+def _file_details(file_path, stat_key=None):
+    """Formatierte Details einer Datei für die Anzeige"""
+    # Lade detaillierte Informationen (mit bekanntem stat_key ohne erneutes stat)
+    file_details = get_music_tagger().load_file(file_path, stat_key)
+    
+    if not file_details:
+        return None
+    
+    # Formatiere Details für Anzeige
+    details = {
+        'Dateiname': file_details.get('filename'),
+        'Pfad': file_details.get('path'),
+        'Artist (aktuell)': file_details.get('current_artist') or 'Nicht gesetzt',
+        'Titel (aktuell)': file_details.get('current_title') or 'Nicht gesetzt',
+        'Album (aktuell)': file_details.get('current_album') or 'Nicht gesetzt',
+        'Genre (aktuell)': file_details.get('current_genre') or 'Nicht gesetzt',
+        'Cover': 'Ja' if file_details.get('current_has_cover') else 'Nein'
+    }
+    
+    # Füge ID3-Details hinzu wenn verfügbar
+    if file_details.get('current_full_tags'):
+        for key, value in file_details['current_full_tags'].items():
+            if value and key not in details:
+                details[f'ID3 {key}'] = value
+    
+    return details
+
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
+    error = None
     if request.method == 'POST':
         directory = request.form['directory'].strip()
-        if os.path.isdir(directory):
-            norm_path = os.path.normpath(directory).lstrip('/')
-            return redirect(url_for('process', directory=norm_path))
-    return render_template('index.html')
+        full_path = _resolve_directory(directory)
+        # Ein Durchlauf prüft Existenz und MP3-Inhalt, Abbruch beim ersten Treffer
+        if full_path and has_mp3_files(full_path):
+            return redirect(url_for('process', directory=full_path.lstrip('/')))
+        error = f"Keine MP3-Dateien gefunden in: {directory}"
+    return render_template('index.html', error=error)
 
 @app.route('/process/<path:directory>')
 def process(directory):
     try:
-        # Dekodiere den directory parameter und baue den absoluten Pfad
-        full_path = os.path.abspath(os.path.join('/', directory))
+        # Absoluter, aufgelöster Pfad - nur innerhalb von MP3_ALLOWED_ROOTS
+        full_path = _resolve_directory(directory)
         
-        if not os.path.isdir(full_path):
-            return f"Verzeichnis nicht gefunden: {full_path}", 404
+        if full_path is None or _safe_stat(full_path)[1] != 'dir':
+            return f"Verzeichnis nicht gefunden: /{directory}", 404
         
-        tagger = MusicTagger()
-        files_data = tagger.scan_directory(full_path)
-        print(f"DEBUG: Gefundene Dateien: {len(files_data)}")
+        files_data = _scan(full_path)
         
         # Keine Online-Metadaten in der ersten Ansicht - nur IST-Daten
-        enhanced_files = files_data
-        print(f"DEBUG: Verarbeitete Ergebnisse: {len(enhanced_files)}")
-        
-        grouped_results = group_by_directory(enhanced_files)
-        print(f"DEBUG: Gruppierte Ergebnisse: {list(grouped_results.keys())}")
-        
-        return render_template('results.html', 
-                            results=grouped_results,
-                            directory=full_path)
+        grouped_results = group_by_directory(files_data)
+        logging.debug("Scan: %d Dateien in %d Verzeichnissen", len(files_data), len(grouped_results))
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            # Verzeichnisliste nur aufbauen, wenn sie auch ausgegeben wird
+            logging.debug("Gruppierte Verzeichnisse: %s", list(grouped_results))
+        
+        # Tabelle wird stückweise gesendet statt als ein großer String gerendert
+        return Response(stream_template('results.html', 
+                                        results=grouped_results,
+                                        directory=full_path),
+                        mimetype='text/html')
     
     except Exception as e:
         return f"Fehler: {str(e)}", 500
 
 @app.route('/recognize_audio', methods=['POST'])
 def recognize_audio_endpoint():
-    """API-Endpunkt für Audio-Erkennung"""
+    """API-Endpunkt für Audio-Erkennung - startet einen Hintergrund-Auftrag (202 + job_id)"""
     try:
-        data = request.get_json()
-        file_path = data.get('file_path')
+        file_path = msgspec.json.decode(request.get_data(), type=FilePathBody).file_path
         
-        if not file_path or not os.path.exists(file_path):
+        if _mp3_stat(file_path) is None:
             return jsonify({'success': False, 'error': 'Datei nicht gefunden'})
         
-        # Audio-Erkennung durchführen
-        result = recognize_audio_file(file_path)
-        
-        if result:
-            return jsonify({
-                'success': True,
-                'result': {
-                    'artist': result.get('artist'),
-                    'title': result.get('title'),
-                    'album': result.get('album'),
-                    'service': result.get('service'),
-                    'confidence': result.get('confidence', 0)
-                }
-            })
-        else:
-            return jsonify({'success': False, 'error': 'Keine Erkennung möglich'})
+        # Audio-Erkennung im Hintergrund durchführen
+        return _start_recognition(_recognize_audio_result, file_path)
             
     except Exception as e:
         logging.error(f"Audio-Erkennung fehlgeschlagen: {str(e)}")
         return jsonify({'success': False, 'error': str(e)})
 
-@app.route('/get_file_details', methods=['POST'])
+@app.route('/get_file_details', methods=['GET', 'POST'])
 def get_file_details():
-    """API-Endpunkt für detaillierte Datei-Informationen"""
+    """API-Endpunkt für detaillierte Datei-Informationen (GET mit ETag/304 oder POST)"""
     try:
-        data = request.get_json()
-        file_path = data.get('file_path')
+        if request.method == 'GET':
+            file_path = request.args.get('file_path')
+        else:
+            file_path = msgspec.json.decode(request.get_data(), type=FilePathBody).file_path
         
-        if not file_path or not os.path.exists(file_path):
-            return jsonify({'success': False, 'error': 'Datei nicht gefunden'})
+        st = _mp3_stat(file_path)
+        if st is None:
+            return _json({'success': False, 'error': 'Datei nicht gefunden'})
         
-        tagger = MusicTagger()
-        # Erstelle temporäre file_data für Details
-        file_data = {
-            'path': file_path,
-            'filename': os.path.basename(file_path)
-        }
+        # Unveränderte Datei -> 304 ohne Body und ohne JSON-Serialisierung
+        etag = f"{st.st_mtime_ns:x}-{st.st_size:x}"
+        if request.method == 'GET' and _etag_fresh(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
         
-        # Lade detaillierte Informationen
-        files_data = tagger.scan_directory(os.path.dirname(file_path))
-        file_details = next((f for f in files_data if f['path'] == file_path), None)
+        body = _file_details_body(file_path, st.st_mtime_ns, st.st_size)
         
-        if file_details:
-            # Formatiere Details für Anzeige
-            details = {
-                'Dateiname': file_details.get('filename'),
-                'Pfad': file_details.get('path'),
-                'Artist (aktuell)': file_details.get('current_artist') or 'Nicht gesetzt',
-                'Titel (aktuell)': file_details.get('current_title') or 'Nicht gesetzt',
-                'Album (aktuell)': file_details.get('current_album') or 'Nicht gesetzt',
-                'Genre (aktuell)': file_details.get('current_genre') or 'Nicht gesetzt',
-                'Cover': 'Ja' if file_details.get('current_has_cover') else 'Nein'
-            }
-            
-            # Füge ID3-Details hinzu wenn verfügbar
-            if file_details.get('current_full_tags'):
-                for key, value in file_details['current_full_tags'].items():
-                    if value and key not in details:
-                        details[f'ID3 {key}'] = value
-            
-            return jsonify({'success': True, 'details': details})
+        if body:
+            response = Response(body, mimetype='application/json')
+            response.headers['Cache-Control'] = 'private, max-age=60'
+            response.set_etag(etag)
+            return response
         else:
-            return jsonify({'success': False, 'error': 'Datei-Details nicht verfügbar'})
+            return _json({'success': False, 'error': 'Datei-Details nicht verfügbar'})
             
     except Exception as e:
         logging.error(f"Datei-Details fehlgeschlagen: {str(e)}")
-        return jsonify({'success': False, 'error': str(e)})
+        return _json({'success': False, 'error': str(e)})
 
 @app.route('/get_cover_preview')
 def get_cover_preview():
@@ -134,30 +585,50 @@ def get_cover_preview():
     try:
         file_path = request.args.get('file_path')
         
-        if not file_path or not os.path.exists(file_path):
+        st = _mp3_stat(file_path)
+        if st is None:
             return "Cover nicht gefunden", 404
         
-        # Versuche Cover direkt aus MP3 zu extrahieren
-        import eyed3
-        eyed3.log.setLevel("ERROR")  # Weniger Logging
+        # WebP nur für Browser, die es ausdrücklich akzeptieren
+        webp = 'image/webp' in request.headers.get('Accept', '')
+        thumb_size = _thumb_size(request.args.get('size', type=int))
+        
+        # Validatoren aus dem stat - ein unverändertes Cover wird ohne Lesen der MP3 mit 304 bestätigt
+        etag = hashlib.blake2b(
+            f"{file_path}:{st.st_mtime_ns}:{st.st_size}:{webp}:{thumb_size}".encode(), digest_size=16
+        ).hexdigest()
+        last_modified = datetime.fromtimestamp(int(st.st_mtime), tz=timezone.utc)
+        if request.if_none_match:
+            fresh = request.if_none_match.contains(etag)
+        else:
+            fresh = request.if_modified_since is not None and request.if_modified_since >= last_modified
+        if fresh:
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.headers['Cache-Control'] = COVER_CACHE_CONTROL
+            response.vary.add('Accept')
+            return response
         
-        audiofile = eyed3.load(file_path)
-        if audiofile and audiofile.tag and audiofile.tag.images:
-            # Erstes Bild verwenden
-            image = audiofile.tag.images[0]
-            cover_data = image.image_data
-            
-            # Bestimme MIME-Type
-            mime_type = 'image/jpeg'  # Standard
-            if image.mime_type:
-                mime_type = image.mime_type
-            elif image.image_data[:3] == b'\x89PN':
-                mime_type = 'image/png'
+        cover = _cached_cover(file_path, st.st_mtime_ns, st.st_size, webp, thumb_size)
+        if cover is _LARGE_COVER:
+            cover = _load_cover_preview(file_path, webp, thumb_size)
+        if cover:
+            mime_type, cover_data = cover
             
-            response = make_response(cover_data)
-            response.headers['Content-Type'] = mime_type
+            if COVER_ACCEL_PREFIX and COVER_CACHE_DIR:
+                # Einmal auf Platte schreiben, danach liefert nginx die Bytes per sendfile aus
+                response = Response(mimetype=mime_type)
+                response.headers['X-Accel-Redirect'] = f"{COVER_ACCEL_PREFIX}/{_cover_cache_file(etag, cover)}"
+            else:
+                # Das fertige Thumbnail liegt bereits im Speicher: als einzelner Chunk ohne
+                # Kopie übergeben (send_file(BytesIO) würde es in 8-KB-Blöcke zerlegen)
+                response = Response(cover_data, mimetype=mime_type)
             response.headers['Content-Disposition'] = 'inline'
-            response.headers['Cache-Control'] = 'public, max-age=3600'  # Cache für 1 Stunde
+            response.headers['Cache-Control'] = COVER_CACHE_CONTROL
+            response.vary.add('Accept')
+            response.set_etag(etag)
+            response.last_modified = last_modified
             return response
         else:
             return "Kein internes Cover gefunden", 404
@@ -170,15 +641,15 @@ def get_cover_preview():
 def get_cover_preview_old():
     """API-Endpunkt für Cover-Vorschau"""
     try:
-        data = request.get_json()
-        file_path = data.get('file_path')
+        file_path = msgspec.json.decode(request.get_data(), type=FilePathBody).file_path
         
-        if not file_path or not os.path.exists(file_path):
+        # Kein eigenes stat vorab - eyed3 prüft beim Laden ohnehin, ob die Datei existiert
+        if not file_path or not is_mp3_filename(file_path) or not _is_allowed_path(file_path):
             return jsonify({'success': False, 'error': 'Datei nicht gefunden'})
         
-        tagger = MusicTagger()
-        files_data = tagger.scan_directory(os.path.dirname(file_path))
-        file_details = next((f for f in files_data if f['path'] == file_path), None)
+        # Nur die Metadaten dieser Datei - die Bildbytes liefert /get_cover_preview direkt
+        # (binär, mit ETag/Caching) statt als Base64-Data-URL im JSON
+        file_details = get_music_tagger().load_file(file_path)
         
         if file_details:
             # Versuche Cover zu finden
@@ -187,11 +658,11 @@ def get_cover_preview_old():
             size = None
             
             # Interne Cover
-            if file_details.get('current_cover_preview'):
-                cover_url = f"data:image/jpeg;base64,{file_details['current_cover_preview']}"
+            if file_details.get('current_cover_info'):
+                # Großansicht im Modal - größte Vorschaustufe statt des Originals
+                cover_url = url_for('get_cover_preview', file_path=file_path, size=COVER_THUMB_SIZES[-1])
                 source = "Intern (MP3)"
-                if file_details.get('current_cover_info'):
-                    size = file_details['current_cover_info'].get('size')
+                size = file_details['current_cover_info'].get('size')
             
             # Externe Cover oder Online-Cover
             elif file_details.get('suggested_cover_url'):
@@ -216,63 +687,97 @@ def get_cover_preview_old():
 
 @app.route('/process_files', methods=['POST'])
 def process_files():
-    """API-Endpunkt für Datei-Verarbeitung"""
+    """API-Endpunkt für Datei-Verarbeitung - startet einen Hintergrund-Auftrag (202 + job_id)"""
     try:
-        data = request.get_json()
-        files = data.get('files', [])
+        try:
+            files = msgspec.json.decode(request.get_data(), type=ProcessFilesBody).files
+        except msgspec.DecodeError as e:
+            return _json({'success': False, 'error': f"Ungültige Anfrage: {str(e)}"}, status=400)
         
         if not files:
-            return jsonify({'success': False, 'error': 'Keine Dateien ausgewählt'})
-        
-        tagger = MusicTagger()
-        processed_count = 0
-        
-        for file_info in files:
-            file_path = file_info.get('path')
-            
-            if not file_path or not os.path.exists(file_path):
-                continue
-            
-            try:
-                # Aktualisiere ID3-Tags
-                success = tagger.update_id3_tags(
-                    file_path,
-                    artist=file_info.get('artist'),
-                    title=file_info.get('title'),
-                    album=file_info.get('album'),
-                    track=file_info.get('track')
-                )
-                
-                if success:
-                    processed_count += 1
-                    
-            except Exception as e:
-                logging.error(f"Fehler bei Verarbeitung von {file_path}: {str(e)}")
-                continue
-        
-        return jsonify({
-            'success': True,
-            'processed_count': processed_count,
-            'total_files': len(files)
-        })
+            return _json({'success': False, 'error': 'Keine Dateien ausgewählt'})
+        
+        # Je Pfad nur ein Auftrag (der letzte gewinnt), damit nie zwei Threads gleichzeitig dieselbe Datei schreiben
+        jobs = list({file_info.path: file_info for file_info in files}.values())
+        job_id = uuid.uuid4().hex
+        job = {'pending': len(jobs), 'processed_count': 0, 'total_files': len(files), 'errors': []}
+        
+        with _write_jobs_lock:
+            _write_jobs[job_id] = job
+            # Nur die letzten Aufträge behalten, abgeschlossene zuerst verwerfen
+            while len(_write_jobs) > MAX_WRITE_JOBS:
+                oldest = next((key for key, old in _write_jobs.items() if not old['pending']), None)
+                if oldest is None:
+                    break
+                del _write_jobs[oldest]
+        
+        for file_info in jobs:
+            future = _write_executor.submit(_write_tags, file_info)
+            future.add_done_callback(lambda future, job=job: _finish_write(job, *future.result()))
+        
+        response = _json({'success': True, 'job_id': job_id, 'total_files': len(files)}, status=202)
+        response.headers['Location'] = url_for('process_files_status', job_id=job_id)
+        return response
         
     except Exception as e:
         logging.error(f"Datei-Verarbeitung fehlgeschlagen: {str(e)}")
-        return jsonify({'success': False, 'error': str(e)})
+        return _json({'success': False, 'error': str(e)})
+
+@app.route('/process_files/status/<job_id>')
+def process_files_status(job_id):
+    """Fortschritt eines /process_files-Auftrags"""
+    with _write_jobs_lock:
+        job = _write_jobs.get(job_id)
+        if job is None:
+            return _json({'success': False, 'error': 'Auftrag nicht gefunden'}, status=404)
+        status = {
+            'success': True,
+            'finished': not job['pending'],
+            'done': job['processed_count'] + len(job['errors']),
+            'processed_count': job['processed_count'],
+            'total_files': job['total_files'],
+            'errors': list(job['errors'])
+        }
+    return _json(status)
 
 @app.route('/static/audio/<path:filename>')
 def serve_audio(filename):
     """Serve audio files for playback"""
     try:
-        # Decode filename and construct full path
-        file_path = os.path.abspath(os.path.join('/', filename))
-        directory = os.path.dirname(file_path)
-        filename = os.path.basename(file_path)
+        file_path = _resolve_audio_path(filename)
+        if file_path is None:
+            return "Datei nicht gefunden", 404
         
-        if os.path.exists(file_path) and file_path.endswith('.mp3'):
-            return send_from_directory(directory, filename, mimetype='audio/mpeg')
-        else:
+        # Ein stat für Existenz, Dateityp und ETag - die 304-Antwort kommt ohne send_file aus
+        st = _mp3_stat(file_path)
+        if st is None:
             return "Datei nicht gefunden", 404
+        
+        # Hinter nginx übernimmt der Webserver Range-Requests und sendfile(2) vollständig
+        if X_ACCEL_PREFIX:
+            response = Response(mimetype='audio/mpeg')
+            response.headers['X-Accel-Redirect'] = X_ACCEL_PREFIX + quote(file_path)
+            return response
+        
+        # Erneutes Abspielen einer unveränderten Datei: 304, ohne die Datei zu öffnen
+        etag = f"{st.st_mtime_ns:x}-{st.st_size:x}"
+        if not request.range and request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.cache_control.public = True
+            response.cache_control.max_age = 3600
+            return response
+        
+        # Pfad statt Dateiobjekt: send_file kennt so die Größe und beantwortet Range-Requests mit 206
+        # (mit X-Sendfile liefert der vorgeschaltete Webserver die Bytes per sendfile(2) aus)
+        return send_file(
+            file_path,
+            mimetype='audio/mpeg',
+            conditional=True,
+            etag=etag,
+            last_modified=st.st_mtime,
+            max_age=3600  # Wiederholtes Abspielen/Springen aus dem Browser-Cache
+        )
             
     except Exception as e:
         logging.error(f"Audio-Serve fehlgeschlagen: {str(e)}")
@@ -287,33 +792,32 @@ def enhanced_search():
         if not selected_files:
             return "Keine Dateien ausgewählt", 400
         
-        tagger = MusicTagger()
+        tagger = get_music_tagger()
         
-        # Erstelle file_data für ausgewählte Dateien
-        files_data = []
-        for file_path in selected_files:
-            if os.path.exists(file_path):
-                file_data = {
-                    'path': file_path,
-                    'filename': os.path.basename(file_path)
-                }
-                # Lade aktuelle ID3-Tags
-                tagger.load_current_tags(file_data)
-                files_data.append(file_data)
-        
-        # Führe Online-Metadaten-Suche durch
-        enhanced_files = tagger.get_metadata_for_files(files_data)
+        # Erstelle file_data nur für die ausgewählten Dateien - parallel gelesen, ohne die
+        # Verzeichnisse (samt Unterverzeichnissen) zu scannen; eigene Datensätze, die Anreicherung darf sie ändern.
+        # Mehrfach ausgewählte Pfade nur einmal lesen und online nachschlagen (Reihenfolge bleibt erhalten)
+        files_data = tagger.load_files(list(dict.fromkeys(
+            path for path in selected_files if is_mp3_filename(path) and _is_allowed_path(path)
+        )))
         
-        # Gruppiere Ergebnisse
-        grouped_results = group_by_directory(enhanced_files)
+        # Gruppiere Dateien - die Online-Suche startet parallel in Anzeigereihenfolge,
+        # jede Zeile wartet beim Rendern nur noch auf ihr eigenes Ergebnis
+        grouped_results = group_by_directory(files_data)
+        enrich = tagger.metadata_service.prefetch_file_metadata(
+            [file_data for files in grouped_results.values() for file_data in files]
+        )
         
         # Extrahiere das ursprüngliche Verzeichnis für den Zurück-Button
         first_file_path = selected_files[0] if selected_files else ''
         directory = os.path.dirname(first_file_path)
         
-        return render_template('results_enhanced.html', 
-                            results=grouped_results,
-                            directory=directory)
+        # Fertige Zeilen gehen sofort an den Browser statt nach Minuten als Ganzes
+        return Response(_stream_enriched(stream_template('results_enhanced.html', 
+                                                         results=grouped_results,
+                                                         directory=directory,
+                                                         enrich=enrich), enrich),
+                        mimetype='text/html')
         
     except Exception as e:
         logging.error(f"Enhanced Search fehlgeschlagen: {str(e)}")
@@ -321,25 +825,48 @@ def enhanced_search():
 
 @app.route('/recognize_album', methods=['POST'])
 def recognize_album():
-    """Album-Erkennung für komplettes Verzeichnis"""
+    """Album-Erkennung für ein oder mehrere Verzeichnisse - startet einen Hintergrund-Auftrag (202 + job_id)"""
     try:
-        data = request.get_json()
-        directory_path = data.get('directory_path')
+        body = msgspec.json.decode(request.get_data(), type=DirectoryBody)
         
-        if not directory_path or not os.path.isdir(directory_path):
-            return jsonify({'success': False, 'error': 'Verzeichnis nicht gefunden'})
+        if body.directory_paths:
+            # Mehrere Verzeichnisse in einem Auftrag - teilen sich Lookup-Cache und MusicBrainz-Limit
+            full_paths = list(dict.fromkeys(_resolve_directory(path) for path in body.directory_paths if path))
+            if not full_paths or any(path is None or _safe_stat(path)[1] != 'dir' for path in full_paths):
+                return jsonify({'success': False, 'error': 'Verzeichnis nicht gefunden'})
+            return _start_recognition(_recognize_albums_result, full_paths)
         
-        # Initialisiere Album-Erkennungsservice
-        album_service = AlbumRecognitionService()
+        directory_path = body.directory_path
         
-        # Führe Album-Erkennung durch
-        result = album_service.recognize_album_from_directory(directory_path)
+        # Wie /process: einmal auflösen und nur mit dem geprüften Pfad weiterarbeiten
+        full_path = _resolve_directory(directory_path) if directory_path else None
+        if full_path is None or _safe_stat(full_path)[1] != 'dir':
+            return jsonify({'success': False, 'error': 'Verzeichnis nicht gefunden'})
         
-        return jsonify(result)
+        # Führe Album-Erkennung im Hintergrund durch
+        return _start_recognition(_recognize_album_result, full_path)
         
     except Exception as e:
         logging.error(f"Album-Erkennung fehlgeschlagen: {str(e)}")
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/recognition/status/<job_id>')
+def recognition_status(job_id):
+    """Stand eines /recognize_audio- bzw. /recognize_album-Auftrags, fertig mit der Erkennungs-Antwort"""
+    with _recognition_jobs_lock:
+        future = _recognition_jobs.get(job_id)
+    if future is None:
+        return _json({'success': False, 'error': 'Auftrag nicht gefunden'}, status=404)
+    if not future.done():
+        return _json({'success': True, 'finished': False})
+    return _json({**future.result(), 'finished': True})
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    if os.getenv('FLASK_DEV'):
+        app.run(debug=True)
+    else:
+        # Mehrere Threads, damit laufende Audio-Streams andere Requests nicht blockieren.
+        # Die Endpunkte warten überwiegend auf Netzwerk (MusicBrainz, AcoustID, Shazam) -
+        # ein wartender Thread kostet kaum CPU, daher kann WEB_THREADS deutlich höher liegen
+        from waitress import serve
+        serve(app, host='127.0.0.1', port=5000, threads=int(os.getenv('WEB_THREADS', '16')))
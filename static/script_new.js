@@ -57,15 +57,38 @@ function setupCheckboxEvents() {
  * Update Directory Checkboxes basierend auf File Selections
  */
 function updateDirectoryCheckboxes() {
+    // Ein Durchlauf über alle Datei-Checkboxen statt zwei Selektor-Abfragen pro Verzeichnis
+    const counts = new Map();
+    document.querySelectorAll('.file-checkbox').forEach(checkbox => {
+        const section = checkbox.closest('.directory-section');
+        if (!section) return;
+        
+        let count = counts.get(section.dataset.directory);
+        if (!count) {
+            count = { total: 0, checked: 0 };
+            counts.set(section.dataset.directory, count);
+        }
+        count.total++;
+        if (checkbox.checked) count.checked++;
+    });
+    
     document.querySelectorAll('.directory-checkbox').forEach(dirCheckbox => {
         const dirPath = dirCheckbox.dataset.dir;
-        const fileCheckboxes = document.querySelectorAll(`tr[data-file-path^="${dirPath}"] .file-checkbox`);
-        const checkedFiles = document.querySelectorAll(`tr[data-file-path^="${dirPath}"] .file-checkbox:checked`);
         
-        if (checkedFiles.length === 0) {
+        // Wie beim Markieren zählen Unterverzeichnisse (gleicher Pfad-Präfix) mit
+        let total = 0;
+        let checked = 0;
+        counts.forEach((count, sectionPath) => {
+            if (sectionPath.startsWith(dirPath)) {
+                total += count.total;
+                checked += count.checked;
+            }
+        });
+        
+        if (checked === 0) {
             dirCheckbox.checked = false;
             dirCheckbox.indeterminate = false;
-        } else if (checkedFiles.length === fileCheckboxes.length) {
+        } else if (checked === total) {
             dirCheckbox.checked = true;
             dirCheckbox.indeterminate = false;
         } else {
@@ -260,7 +283,10 @@ function closeAudioPlayer() {
     const audioPlayer = document.getElementById('audio-player');
     
     audioPlayer.pause();
-    audioPlayer.src = '';
+    // src entfernen und neu laden bricht den laufenden Range-Download ab
+    // (src = '' würde stattdessen die aktuelle Seite als Audio anfragen)
+    audioPlayer.removeAttribute('src');
+    audioPlayer.load();
     modal.style.display = 'none';
     currentAudio = null;
 }
@@ -282,7 +308,7 @@ function recognizeAudio(filePath) {
             file_path: filePath
         })
     })
-    .then(response => response.json())
+    .then(response => pollJob(response))
     .then(data => {
         hideProcessingStatus();
         
@@ -488,7 +514,7 @@ function showCoverPreview(filePath) {
     
     modal.style.display = 'block';
     
-    fetch('/get_cover_preview', {
+    fetch('/get_cover_preview_old', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
@@ -569,7 +595,9 @@ function saveChanges() {
             files: updates
         })
     })
-    .then(response => response.json())
+    .then(response => pollJob(response, status => {
+        showProcessingStatus(`Speichere Änderungen: ${status.done} von ${updates.length} Datei(en)...`);
+    }))
     .then(data => {
         hideProcessingStatus();
         
@@ -610,7 +638,7 @@ function recognizeAlbum(directoryPath) {
             directory_path: directoryPath
         })
     })
-    .then(response => response.json())
+    .then(response => pollJob(response))
     .then(data => {
         hideProcessingStatus();
         
@@ -707,14 +735,16 @@ function applyAlbumCandidate(candidateIndex, directoryPath) {
     const directoryRows = document.querySelectorAll(`tr[data-file-path^="${directoryPath}"]`);
     
     // Sortiere Zeilen nach intelligenter Track-Erkennung
-    const rowsWithTrackInfo = Array.from(directoryRows).map(row => {
+    // Index und Sortierschlüssel einmal pro Zeile bestimmen statt indexOf/toLowerCase je Vergleich
+    const rowsWithTrackInfo = Array.from(directoryRows, (row, index) => {
         const fileName = row.dataset.filePath.split('/').pop();
         const trackNumber = extractTrackNumberFromFilename(fileName);
         return {
             row: row,
             fileName: fileName,
+            sortName: fileName.toLowerCase(),
             detectedTrack: trackNumber,
-            originalOrder: Array.from(directoryRows).indexOf(row)
+            originalOrder: index
         };
     });
     
@@ -727,7 +757,7 @@ function applyAlbumCandidate(candidateIndex, directoryPath) {
         } else if (b.detectedTrack) {
             return 1;
         } else {
-            return a.fileName.toLowerCase().localeCompare(b.fileName.toLowerCase());
+            return a.sortName.localeCompare(b.sortName);
         }
     });
     
@@ -903,7 +933,9 @@ function processSelected() {
             files: selectedFiles
         })
     })
-    .then(response => response.json())
+    .then(response => pollJob(response, status => {
+        showProcessingStatus(`${status.done} von ${selectedFiles.length} Datei(en) verarbeitet...`);
+    }))
     .then(data => {
         hideProcessingStatus();
         
@@ -928,6 +960,23 @@ function goBack() {
     window.location.href = '/';
 }
 
+/**
+ * Hintergrund-Auftrag (/process_files, /recognize_audio, /recognize_album) über die
+ * Status-URL aus dem Location-Header abfragen bis er fertig ist - liefert den letzten Status
+ */
+async function pollJob(response, onProgress) {
+    const started = await response.json();
+    if (!started.job_id) return started;  // Fehler direkt beim Start
+    const statusUrl = response.headers.get('Location');
+    
+    while (true) {
+        const status = await fetch(statusUrl).then(r => r.json());
+        if (!status.success || status.finished) return status;
+        if (onProgress) onProgress(status);
+        await new Promise(resolve => setTimeout(resolve, 500));
+    }
+}
+
 /**
  * Processing Status anzeigen
  */
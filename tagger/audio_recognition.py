@@ -6,21 +6,88 @@ Modul für die Erkennung von Audio-Dateien über ShazamIO und AcoustID
 import logging
 import asyncio
 import os
+import threading
+from functools import lru_cache
 from shazamio import Shazam
-import requests
-import aiofiles
+from .http_session import get_http_session
+from .recognition_cache import get_recognition_cache, fingerprint_hash
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# Obergrenzen gleichzeitiger Anfragen je Dienst (AcoustID erlaubt ca. 3 Anfragen pro Sekunde)
+SHAZAM_CONCURRENCY = 4
+ACOUSTID_CONCURRENCY = 3
+# Höchstens 20 Shazam-Anfragen pro Minute - Shazam drosselt sonst für Minuten
+SHAZAM_MIN_INTERVAL = 3.0
+# Gemerkte Fingerprints je (Pfad, mtime, Größe) - ein fpcalc-Lauf dekodiert die komplette Datei
+FINGERPRINT_CACHE_SIZE = 4096
+
+# Gemeinsame Event-Loop für alle async-Aufrufe (ShazamIO), läuft in einem Daemon-Thread
+_event_loop = None
+_event_loop_lock = threading.Lock()
+
+
+def _get_event_loop():
+    """Startet die gemeinsame Event-Loop beim ersten Aufruf und liefert sie zurück"""
+    global _event_loop
+    with _event_loop_lock:
+        if _event_loop is None:
+            _event_loop = asyncio.new_event_loop()
+            threading.Thread(target=_event_loop.run_forever, name='audio-recognition-loop', daemon=True).start()
+    return _event_loop
+
+
+def run_async(coro):
+    """Führt eine Coroutine auf der gemeinsamen Event-Loop aus und wartet auf das Ergebnis"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_event_loop()).result()
+
+
+@lru_cache(maxsize=FINGERPRINT_CACHE_SIZE)
+def _cached_fingerprint(file_path, mtime_ns, size):
+    """
+    Erstellt den AcoustID Fingerprint einer Datei über fpcalc
+
+    mtime_ns und Größe gehören zum Cache-Schlüssel, damit eine geänderte Datei neu
+    berechnet wird - Erkennung, Bestätigung und erweiterte Suche teilen sich das Ergebnis.
+    """
+    try:
+        import subprocess
+        import json
+        
+        # fpcalc verwenden für Fingerprint-Erstellung
+        cmd = ['fpcalc', '-json', file_path]
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        
+        if result.returncode == 0:
+            data = json.loads(result.stdout)
+            return {
+                'fingerprint': data.get('fingerprint'),
+                'duration': data.get('duration')
+            }
+        
+        return None
+        
+    except Exception as e:
+        logging.error(f"Fingerprint-Erstellung fehlgeschlagen: {str(e)}")
+        return None
+
+
 class AudioRecognitionService:
     """Service für Audio-Erkennung mit ShazamIO und AcoustID"""
     
     def __init__(self):
         self.acoustid_api_key = os.getenv('ACOUSTID_API_KEY')
         self.min_confidence = 0.6
+        # Keep-Alive-Verbindungen zu AcoustID über Aufrufe hinweg (gemeinsamer Pool aller Dienste)
+        self.session = get_http_session()
+        self._acoustid_slots = threading.BoundedSemaphore(ACOUSTID_CONCURRENCY)
+        # ShazamIO-Client und Semaphore werden auf der gemeinsamen Event-Loop angelegt
+        self._shazam = None
+        self._shazam_slots = None
+        self._shazam_next_request = 0.0
         
     def recognize_audio_file(self, file_path):
         """
@@ -33,17 +100,32 @@ class AudioRecognitionService:
             dict: Erkannte Metadaten oder None
         """
         try:
+            # Lokaler Fingerprint als Cache-Schlüssel - bekanntes Audio braucht keine Online-Anfrage
+            cache = get_recognition_cache()
+            fingerprint_data = self._create_acoustid_fingerprint(file_path) if cache else None
+            fp_hash = None
+            if fingerprint_data and fingerprint_data.get('fingerprint'):
+                fp_hash = fingerprint_hash(fingerprint_data['fingerprint'])
+                cached = cache.lookup(fp_hash)
+                if cached:
+                    logging.info(f"✅ Erkennung aus Cache: {cached.get('artist')} - {cached.get('title')}")
+                    return cached
+            
             # Versuche zuerst ShazamIO (primär)
             shazam_result = self.recognize_with_shazam(file_path)
             if shazam_result and shazam_result.get('confidence', 0) >= self.min_confidence:
                 logging.info(f"✅ ShazamIO erfolgreich: {shazam_result.get('artist')} - {shazam_result.get('title')}")
+                if fp_hash:
+                    cache.store(fp_hash, shazam_result)
                 return shazam_result
             
-            # Fallback auf AcoustID
+            # Fallback auf AcoustID - mit dem bereits berechneten Fingerprint
             logging.info(f"🔄 ShazamIO erfolglos, versuche AcoustID...")
-            acoustid_result = self.recognize_with_acoustid(file_path)
+            acoustid_result = self.recognize_with_acoustid(file_path, fingerprint_data)
             if acoustid_result and acoustid_result.get('confidence', 0) >= self.min_confidence:
                 logging.info(f"✅ AcoustID erfolgreich: {acoustid_result.get('artist')} - {acoustid_result.get('title')}")
+                if fp_hash:
+                    cache.store(fp_hash, acoustid_result)
                 return acoustid_result
             
             logging.warning(f"❌ Keine Erkennung für {file_path}")
@@ -53,6 +135,52 @@ class AudioRecognitionService:
             logging.error(f"Fehler bei Audio-Erkennung: {str(e)}")
             return None
     
+    def confirmed_metadata(self, file_path):
+        """
+        Vom Benutzer bereits geschriebene Tags für identisches Audio
+        
+        Args:
+            file_path (str): Pfad zur Audio-Datei
+            
+        Returns:
+            dict: Bestätigte Metadaten oder None (auch ohne Cache)
+        """
+        try:
+            cache = get_recognition_cache()
+            if not cache:
+                return None
+            # Nur Pfad, mtime und Größe - unbestätigte Dateien kosten keinen fpcalc-Lauf
+            st = os.stat(file_path)
+            return cache.lookup_confirmed_file(file_path, (st.st_mtime_ns, st.st_size))
+            
+        except Exception as e:
+            logging.warning(f"Erkennungs-Cache nicht lesbar: {str(e)}")
+            return None
+    
+    def confirm_metadata(self, file_path, artist, title, album=None):
+        """
+        Merkt geschriebene Tags als bestätigte Erkennung für den Audio-Fingerprint der Datei
+        
+        Args:
+            file_path (str): Pfad zur Audio-Datei
+            artist (str): Geschriebener Künstler
+            title (str): Geschriebener Titel
+            album (str): Geschriebenes Album (optional)
+        """
+        try:
+            cache = get_recognition_cache()
+            if not cache:
+                return
+            # Stand nach dem Schreiben - confirmed_metadata erkennt die Datei daran wieder
+            st = os.stat(file_path)
+            fingerprint_data = _cached_fingerprint(file_path, st.st_mtime_ns, st.st_size)
+            if fingerprint_data and fingerprint_data.get('fingerprint'):
+                cache.confirm(fingerprint_hash(fingerprint_data['fingerprint']), artist, title, album,
+                              path=file_path, stat_key=(st.st_mtime_ns, st.st_size))
+                
+        except Exception as e:
+            logging.warning(f"Bestätigung nicht gespeichert für {file_path}: {str(e)}")
+    
     def recognize_with_shazam(self, file_path):
         """
         Erkennt Audio-Datei mit ShazamIO
@@ -64,15 +192,10 @@ class AudioRecognitionService:
             dict: ShazamIO Ergebnis oder None
         """
         try:
-            # Verwende async context für ShazamIO
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                result = loop.run_until_complete(self._shazam_recognize_async(file_path))
-                return result
-            finally:
-                loop.close()
-                
+            # Gemeinsame Event-Loop statt neuer Loop pro Aufruf;
+            # parallele Requests überlappen ihre Netzwerk-I/O dort
+            return run_async(self._shazam_recognize_async(file_path))
+            
         except Exception as e:
             logging.error(f"ShazamIO Fehler: {str(e)}")
             return None
@@ -80,12 +203,17 @@ class AudioRecognitionService:
     async def _shazam_recognize_async(self, file_path):
         """Async ShazamIO Erkennung"""
         try:
-            shazam = Shazam()
-            
-            async with aiofiles.open(file_path, 'rb') as f:
-                audio_data = await f.read()
+            if self._shazam is None:
+                self._shazam = Shazam()
+                self._shazam_slots = asyncio.Semaphore(SHAZAM_CONCURRENCY)
+            shazam = self._shazam
             
-            result = await shazam.recognize(audio_data)
+            # Pfad statt Bytes: Datei lesen und Signatur berechnen erledigt der Rust-Kern
+            # von ShazamIO außerhalb der Event-Loop, die ganze MP3 landet nicht im Speicher.
+            # Weitere Requests warten, statt Shazam mit parallelen Anfragen zu fluten
+            await self._respect_shazam_rate_limit()
+            async with self._shazam_slots:
+                result = await shazam.recognize(file_path)
             
             if result and 'track' in result:
                 track = result['track']
@@ -125,12 +253,23 @@ class AudioRecognitionService:
             logging.error(f"Async ShazamIO Fehler: {str(e)}")
             return None
     
-    def recognize_with_acoustid(self, file_path):
+    async def _respect_shazam_rate_limit(self):
+        """Verteilt Shazam-Anfragen im Abstand von SHAZAM_MIN_INTERVAL"""
+        # Läuft nur auf der gemeinsamen Event-Loop - Slot reservieren ohne Lock, dann warten
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._shazam_next_request)
+        self._shazam_next_request = slot + SHAZAM_MIN_INTERVAL
+        if slot > now:
+            await asyncio.sleep(slot - now)
+    
+    def recognize_with_acoustid(self, file_path, fingerprint_data=None):
         """
         Erkennt Audio-Datei mit AcoustID
         
         Args:
             file_path (str): Pfad zur Audio-Datei
+            fingerprint_data (dict): Bereits berechneter Fingerprint (optional)
             
         Returns:
             dict: AcoustID Ergebnis oder None
@@ -141,7 +280,8 @@ class AudioRecognitionService:
                 return None
             
             # Audio-Fingerprint erstellen
-            fingerprint_data = self._create_acoustid_fingerprint(file_path)
+            if not fingerprint_data:
+                fingerprint_data = self._create_acoustid_fingerprint(file_path)
             if not fingerprint_data:
                 return None
             
@@ -154,7 +294,8 @@ class AudioRecognitionService:
                 'meta': 'recordings'
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            with self._acoustid_slots:
+                response = self.session.get(url, params=params, timeout=10)
             
             if response.status_code == 200:
                 data = response.json()
@@ -184,27 +325,24 @@ class AudioRecognitionService:
             return None
     
     def _create_acoustid_fingerprint(self, file_path):
-        """Erstellt AcoustID Fingerprint"""
+        """Erstellt AcoustID Fingerprint (gemerkt, solange die Datei unverändert ist)"""
         try:
-            import subprocess
-            import json
-            
-            # fpcalc verwenden für Fingerprint-Erstellung
-            cmd = ['fpcalc', '-json', file_path]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            
-            if result.returncode == 0:
-                data = json.loads(result.stdout)
-                return {
-                    'fingerprint': data.get('fingerprint'),
-                    'duration': data.get('duration')
-                }
-            
-            return None
-            
-        except Exception as e:
+            st = os.stat(file_path)
+        except OSError as e:
             logging.error(f"Fingerprint-Erstellung fehlgeschlagen: {str(e)}")
             return None
+        return _cached_fingerprint(file_path, st.st_mtime_ns, st.st_size)
+
+
+@lru_cache(maxsize=1)
+def get_recognition_service():
+    """
+    Liefert die prozessweit gemeinsame AudioRecognitionService-Instanz
+    
+    HTTP-Session und ShazamIO-Client werden so über Requests hinweg
+    wiederverwendet.
+    """
+    return AudioRecognitionService()
 
 
 def recognize_audio_file(file_path):
@@ -217,8 +355,7 @@ def recognize_audio_file(file_path):
     Returns:
         dict: Erkannte Metadaten oder None
     """
-    service = AudioRecognitionService()
-    return service.recognize_audio_file(file_path)
+    return get_recognition_service().recognize_audio_file(file_path)
 
 
 def recognize_with_shazam(file_path):
@@ -231,8 +368,7 @@ def recognize_with_shazam(file_path):
     Returns:
         dict: ShazamIO Ergebnis oder None
     """
-    service = AudioRecognitionService()
-    return service.recognize_with_shazam(file_path)
+    return get_recognition_service().recognize_with_shazam(file_path)
 
 
 def recognize_with_acoustid(file_path):
@@ -245,5 +381,4 @@ def recognize_with_acoustid(file_path):
     Returns:
         dict: AcoustID Ergebnis oder None
     """
-    service = AudioRecognitionService()
-    return service.recognize_with_acoustid(file_path)
+    return get_recognition_service().recognize_with_acoustid(file_path)
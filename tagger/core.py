@@ -1,21 +1,38 @@
 import os
 import eyed3
 from pathlib import Path
-from difflib import SequenceMatcher
+from rapidfuzz import fuzz
 import requests
 from urllib.parse import quote
 import logging
-import base64
-from collections import defaultdict
+from collections import defaultdict, deque
 import re
+import mmap
+import struct
+from functools import lru_cache
 import asyncio
-from .metadata_enrichment import MetadataEnrichmentService
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .metadata_enrichment import get_enrichment_service
+from .scan_cache import get_scan_cache
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# Parallele ID3-Lesezugriffe und Verzeichnis-Listings beim Verzeichnisscan
+SCAN_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# Dateisignaturen eingebetteter Cover (APIC ohne oder mit ungültigem MIME-Type)
+IMAGE_MAGIC = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF8', 'image/gif'),
+)
+
+# Alle Schreibweisen von .mp3 (nur m und p haben Groß-/Kleinbuchstaben) - Prüfung ohne lower()-Kopie
+MP3_SUFFIXES = ('.mp3', '.MP3', '.Mp3', '.mP3')
+
 class MusicTagger:
     def __init__(self):
         self.lastfm_key = os.getenv('LASTFM_API_KEY')
@@ -23,45 +40,120 @@ class MusicTagger:
         self.discogs_secret = os.getenv('DISCOGS_API_SECRET')
         self.min_confidence = 0.6
         # Initialisiere Metadata-Enrichment-Service
-        self.metadata_service = MetadataEnrichmentService()
+        self.metadata_service = get_enrichment_service()
 
-    def scan_directory(self, directory):
+    def scan_directory(self, directory, parallel=False, stats=None):
+        """
+        Liest alle MP3-Dateien unterhalb eines Verzeichnisses
+        
+        stats (Pfad -> (mtime_ns, size)) kann aus einem bereits erfolgten
+        Verzeichnisdurchlauf übergeben werden, der Baum wird dann nicht erneut gelesen.
+        """
         files = []
         try:
-            for mp3_path in Path(directory).rglob('*.mp3'):
-                try:
-                    audio = eyed3.load(mp3_path)
-                    if audio.tag is None:
-                        audio.initTag()
-
-                    file_data = {
-                        'path': str(mp3_path),
-                        'filename': mp3_path.name,
-                        'directory': str(mp3_path.parent),
-                        'target_path': str(mp3_path),
-                        'current_artist': audio.tag.artist,
-                        'current_title': audio.tag.title,
-                        'current_album': audio.tag.album,
-                        'current_genre': audio.tag.genre.name if audio.tag.genre else None,
-                        'current_has_cover': self._has_cover(audio),
-                        'current_cover_info': self._get_cover_info(audio),
-                        'current_cover_compact': self._get_cover_compact_info(audio),
-                        'current_full_tags': self._get_full_tag_info(audio),
-                        'current_cover_preview': self._get_cover_preview(audio),
-                        'suggested_artist': None,
-                        'suggested_title': None,
-                        'suggested_album': None,
-                        'suggested_genre': None,
-                        'suggested_cover_url': None,
-                        'suggested_full_tags': None
-                    }
+            # Pfad -> (mtime_ns, size); Dateien ohne stat werden gelesen, aber nicht gecacht
+            if stats is None:
+                stats = {}
+                for entry in iter_mp3_files(directory, parallel=parallel):
+                    try:
+                        st = entry.stat()
+                        stats[entry.path] = (st.st_mtime_ns, st.st_size)
+                    except OSError:
+                        stats[entry.path] = None
+            
+            # Unveränderte Dateien kommen aus dem persistenten Scan-Cache
+            scan_cache = get_scan_cache()
+            cached = scan_cache.lookup(directory, stats) if scan_cache else {}
+            missing = [path for path in stats if path not in cached]
+            
+            # ID3-Lesen ist I/O-lastig - mehrere Dateien parallel laden
+            read = {}
+            if missing:
+                with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as executor:
+                    for path, file_data in zip(missing, executor.map(self._read_file_data, missing)):
+                        if file_data:
+                            read[path] = file_data
+            
+            if scan_cache:
+                scan_cache.store(directory, stats, {path: data for path, data in read.items() if stats[path]})
+            
+            # Feste Reihenfolge - stats kann aus einem frozenset oder dem parallelen Scan stammen
+            for path in sorted(stats):
+                file_data = cached.get(path) or read.get(path)
+                if file_data:
                     files.append(file_data)
-                except Exception as e:
-                    logging.error(f"Fehler beim Lesen von {mp3_path}: {str(e)}")
         except Exception as e:
             logging.error(f"Verzeichnisscan fehlgeschlagen: {str(e)}")
         return files
 
+    def load_file(self, file_path, stat_key=None):
+        """
+        Liest den Datensatz einer einzelnen MP3-Datei, ohne ihr Verzeichnis zu scannen
+        
+        Eine unveränderte Datei kommt aus dem persistenten Scan-Cache. Cover-Bytes
+        sind nie Teil des Datensatzes - die liefert /get_cover_preview binär.
+        Hat der Aufrufer die Datei bereits ge-stat-et, spart stat_key=(mtime_ns, Größe)
+        den zweiten stat-Aufruf.
+        """
+        scan_cache = get_scan_cache()
+        if scan_cache is None:
+            return self._read_file_data(file_path)
+        
+        if stat_key is None:
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                return None
+            stat_key = (st.st_mtime_ns, st.st_size)
+        
+        file_data = scan_cache.lookup_file(file_path, stat_key)
+        if file_data is None:
+            file_data = self._read_file_data(file_path)
+            if file_data:
+                scan_cache.store_file(file_path, stat_key, file_data)
+        return file_data
+
+    def load_files(self, file_paths):
+        """Liest die Datensätze einzelner MP3-Dateien parallel, ohne Verzeichnisse zu durchsuchen"""
+        if not file_paths:
+            return []
+        with ThreadPoolExecutor(max_workers=min(SCAN_WORKERS, len(file_paths))) as executor:
+            return [file_data for file_data in executor.map(self.load_file, file_paths) if file_data]
+
+    def _read_file_data(self, mp3_path):
+        """Liest ID3-Tags und Cover-Infos einer MP3-Datei, None bei Fehlern"""
+        try:
+            audio = eyed3.load(mp3_path)
+            if audio.tag is None:
+                audio.initTag()
+
+            # Cover-Bytes bleiben in der Datei, der Datensatz enthält nur Metadaten
+            cover_info = self._get_cover_info(audio)
+            file_data = {
+                'path': mp3_path,
+                'filename': os.path.basename(mp3_path),
+                'directory': os.path.dirname(mp3_path),
+                'target_path': mp3_path,
+                'current_artist': audio.tag.artist,
+                'current_title': audio.tag.title,
+                'current_album': audio.tag.album,
+                'current_genre': audio.tag.genre.name if audio.tag.genre else None,
+                'current_has_cover': self._has_cover(audio),
+                'current_cover_info': cover_info,
+                'current_cover_compact': self._format_cover_compact(cover_info),
+                'current_full_tags': self._get_full_tag_info(audio),
+                'suggested_artist': None,
+                'suggested_title': None,
+                'suggested_album': None,
+                'suggested_genre': None,
+                'suggested_cover_url': None,
+                'suggested_full_tags': None
+            }
+            return file_data
+        except Exception as e:
+            logging.error(f"Fehler beim Lesen von {mp3_path}: {str(e)}")
+            return None
+
     def get_metadata_for_files(self, files_data):
         """Erweiterte Metadatenabfrage mit modularen Services"""
         # Verwende den neuen Metadata-Enrichment-Service
@@ -70,8 +162,6 @@ class MusicTagger:
     def update_id3_tags(self, file_path, artist=None, title=None, album=None, track=None):
         """Update ID3-Tags einer MP3-Datei"""
         try:
-            import eyed3
-            
             audio = eyed3.load(file_path)
             if audio.tag is None:
                 audio.initTag()
@@ -174,23 +264,15 @@ class MusicTagger:
 
     def _get_cover_compact_info(self, audio):
         """Kompakte Cover-Info für Anzeige"""
-        cover_info = self._get_cover_info(audio)
+        return self._format_cover_compact(self._get_cover_info(audio))
+
+    def _format_cover_compact(self, cover_info):
+        """Formatiert bereits gelesene Cover-Infos kompakt"""
         if cover_info:
             size_kb = cover_info['size'] // 1024
             return f"{cover_info['mime_type']} ({size_kb} KB)"
         return "None"
 
-    def _get_cover_preview(self, audio):
-        """Base64-encoded Cover-Preview"""
-        try:
-            if audio.tag and audio.tag.images:
-                image_data = audio.tag.images[0].image_data
-                if image_data:
-                    return base64.b64encode(image_data).decode('utf-8')
-        except:
-            pass
-        return None
-
     def _get_full_tag_info(self, audio):
         """Extrahiert alle verfügbaren Tag-Informationen"""
         try:
@@ -273,6 +355,17 @@ class MusicTagger:
         return results
 
 
+@lru_cache(maxsize=1)
+def get_music_tagger():
+    """
+    Liefert die prozessweit gemeinsame MusicTagger-Instanz
+
+    MusicTagger hält nach dem Konstruktor keinen veränderlichen Zustand,
+    kann also von allen Request-Threads gleichzeitig benutzt werden.
+    """
+    return MusicTagger()
+
+
 def group_by_directory(files_data):
     """Gruppiert Dateien nach Verzeichnis"""
     grouped = defaultdict(list)
@@ -288,11 +381,193 @@ def group_by_directory(files_data):
     return dict(grouped)
 
 
+def iter_mp3_files(directory, parallel=False, recursive=True):
+    """
+    Liefert alle MP3-Dateien unterhalb eines Verzeichnisses als os.DirEntry
+
+    Iterative Traversierung mit os.scandir: Der Dateityp kommt direkt aus dem
+    Verzeichniseintrag, es wird also kein zusätzliches stat pro Datei benötigt.
+    Symlinks auf Verzeichnisse werden nicht verfolgt.
+
+    Mit parallel=True werden die Unterverzeichnisse auf einem Thread-Pool
+    gelistet (Reihenfolge dann nicht festgelegt). Das lohnt sich nur bei
+    verzweigten Bäumen, etwa Interpret/Album/; ein flaches Verzeichnis ist
+    ein einziges Listing und wird dadurch nicht schneller.
+
+    Mit recursive=False nur die Dateien direkt im Verzeichnis (z.B. ein Album).
+    """
+    if not recursive:
+        yield from _scan_mp3_dir(directory)[0]
+        return
+
+    if parallel:
+        yield from _iter_mp3_files_parallel(directory)
+        return
+
+    stack = deque([directory])
+    while stack:
+        files, subdirs = _scan_mp3_dir(stack.pop())
+        stack.extend(subdirs)
+        yield from files
+
+
+def _iter_mp3_files_parallel(directory):
+    """Breitensuche, bei der jedes Verzeichnis-Listing als eigener Task läuft"""
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as executor:
+        pending = {executor.submit(_scan_mp3_dir, directory)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                pending.update(executor.submit(_scan_mp3_dir, subdir) for subdir in subdirs)
+                yield from files
+
+
+def _scan_mp3_dir(path):
+    """Listet ein Verzeichnis: (MP3-Einträge, Unterverzeichnis-Pfade)"""
+    files, subdirs = [], []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif is_mp3_filename(entry.name) and entry.is_file():
+                    # is_file kommt aus d_type (nur Symlinks brauchen ein stat, das der Eintrag
+                    # für das spätere entry.stat() zwischenspeichert) - defekte Links fallen weg
+                    files.append(entry)
+    except OSError as e:
+        logging.error(f"Verzeichnis nicht lesbar {path}: {str(e)}")
+    return files, subdirs
+
+
+def is_mp3_filename(name):
+    """Prüft die Dateiendung .mp3 ohne Beachtung der Groß-/Kleinschreibung"""
+    return name.endswith(MP3_SUFFIXES)
+
+
+def has_mp3_files(directory):
+    """Prüft ob ein Verzeichnis (rekursiv) mindestens eine MP3-Datei enthält"""
+    # Bricht beim ersten Treffer ab, fehlende Verzeichnisse liefern False
+    if not hasattr(os, 'fwalk'):
+        # Windows: kein fwalk, daher scandir-Traversierung
+        return next(iter_mp3_files(directory), None) is not None
+
+    # POSIX: fwalk arbeitet mit Verzeichnis-Deskriptoren statt vollständiger Pfade
+    def log_error(e):
+        logging.error(f"Verzeichnis nicht lesbar {e.filename}: {str(e)}")
+
+    try:
+        for _root, _dirs, files, _rootfd in os.fwalk(directory, onerror=log_error):
+            if any(is_mp3_filename(name) for name in files):
+                return True
+    except OSError as e:
+        # Fehler beim Startverzeichnis meldet fwalk nicht über onerror
+        log_error(e)
+    return False
+
+
+def _syncsafe(data):
+    """Dekodiert eine 28-Bit Syncsafe-Ganzzahl (7 Bit pro Byte)"""
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def read_apic(file_path):
+    """
+    Liest nur das erste APIC-Frame (eingebettetes Cover) aus einem ID3v2.3/2.4-Tag
+
+    Die Frame-Header werden direkt im per mmap eingeblendeten Tag gelesen und alle
+    anderen Frames übersprungen, statt sie wie bei eyed3.load vollständig zu dekodieren.
+    Die Bilddaten werden genau einmal kopiert.
+
+    Returns:
+        tuple: (mime_type, image_data) oder None wenn kein Cover vorhanden ist
+
+    Raises:
+        ValueError: Bei Tag-Varianten, die nur eyed3 lesen kann (ID3v2.2, Unsynchronisation,
+            komprimierte/verschlüsselte Frames, abgeschnittene Tags)
+    """
+    with open(file_path, 'rb') as f:
+        header = f.read(10)
+        if len(header) < 10 or header[:3] != b'ID3':
+            return None
+
+        version, flags = header[3], header[5]
+        if version not in (3, 4) or flags & 0x80:
+            raise ValueError(f"ID3v2.{version} (Flags {flags:#x}) nicht unterstützt")
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            tag_end = min(10 + _syncsafe(header[6:10]), len(buf))
+            pos = 10
+            if flags & 0x40:
+                # Erweiterten Header überspringen (v2.3: Größe ohne, v2.4: mit den 4 Größen-Bytes)
+                ext = buf[10:14]
+                pos += _syncsafe(ext) if version == 4 else int.from_bytes(ext, 'big') + 4
+
+            while pos + 10 <= tag_end:
+                frame_id, size, frame_flags = struct.unpack_from('>4sIH', buf, pos)
+                if frame_id[0] == 0:
+                    break  # Padding
+                if version == 4:
+                    size = _syncsafe(buf[pos + 4:pos + 8])
+
+                start, pos = pos + 10, pos + 10 + size
+                if frame_id != b'APIC':
+                    continue
+
+                # v2.3: Kompression/Verschlüsselung, v2.4: zusätzlich Unsync/Datenlänge
+                if frame_flags & (0x000F if version == 4 else 0x00C0):
+                    raise ValueError(f"APIC-Frame mit Flags {frame_flags:#x} nicht unterstützt")
+                if pos > tag_end:
+                    raise ValueError("APIC-Frame abgeschnitten")
+                return _parse_apic(buf, start, pos)
+
+    return None
+
+
+def _parse_apic(buf, start, end):
+    """Zerlegt ein APIC-Frame in buf[start:end]: Encoding, MIME-Type, Bildtyp, Beschreibung, Bilddaten"""
+    if start >= end:
+        raise ValueError("Leeres APIC-Frame")
+    encoding = buf[start]
+    mime_end = buf.find(b'\x00', start + 1, end)
+    if mime_end < 0:
+        raise ValueError("APIC-MIME-Type ohne Abschluss")
+    mime_type = buf[start + 1:mime_end].decode('latin-1')
+
+    # Beschreibung endet bei UTF-16 (Encoding 1/2) mit zwei Null-Bytes auf gerader Position
+    pos = mime_end + 2
+    if encoding in (1, 2):
+        while buf[pos:pos + 2] != b'\x00\x00':
+            pos += 2
+            if pos + 2 > end:
+                raise ValueError("APIC-Beschreibung ohne Abschluss")
+        pos += 2
+    else:
+        pos = buf.find(b'\x00', pos, end)
+        if pos < 0:
+            raise ValueError("APIC-Beschreibung ohne Abschluss")
+        pos += 1
+
+    image_data = buf[pos:end]
+    if not mime_type or '/' not in mime_type:
+        # Manche Tagger schreiben nur 'JPG'/'PNG' statt eines MIME-Types
+        mime_type = sniff_image_mime(image_data)
+    return mime_type, image_data
+
+
+def sniff_image_mime(data, default='image/jpeg'):
+    """Bestimmt den MIME-Type eines Bildes anhand der ersten Bytes"""
+    # WebP: RIFF-Container mit 'WEBP' an Offset 8 - startswith mit Startposition statt Slice-Kopien
+    if data.startswith(b'RIFF') and data.startswith(b'WEBP', 8):
+        return 'image/webp'
+    return next((mime for magic, mime in IMAGE_MAGIC if data.startswith(magic)), default)
+
+
 def calculate_similarity(str1, str2):
     """Berechnet Ähnlichkeit zwischen zwei Strings"""
     if not str1 or not str2:
         return 0.0
-    return SequenceMatcher(None, str1.lower(), str2.lower()).ratio()
+    return fuzz.ratio(str1.lower(), str2.lower()) / 100
 
 
 def format_duration(seconds):
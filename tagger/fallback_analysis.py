@@ -13,9 +13,9 @@ import logging
 from typing import Dict, List, Optional, Tuple
 import subprocess
 import json
-import requests
 import eyed3
 import asyncio
+from .http_session import get_http_session
 
 logger = logging.getLogger(__name__)
 
@@ -493,7 +493,7 @@ class FallbackAnalyzer:
             
             files = {'sample': open(file_path, 'rb')}
             
-            response = requests.post(
+            response = get_http_session().post(
                 f"https://{self.acrcloud_host}/v1/identify",
                 files=files,
                 headers=headers,
@@ -615,7 +615,7 @@ class FallbackAnalyzer:
                 'fingerprint': fingerprint_data['fingerprint']
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            response = get_http_session().get(url, params=params, timeout=10)
             response.raise_for_status()
             
             data = response.json()
@@ -7,17 +7,39 @@ import logging
 import subprocess
 import json
 import os
+import re
 import tempfile
 import requests
 import hashlib
 import struct
+import threading
+import time
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from mutagen.mp3 import MP3
+from rapidfuzz import fuzz
+from .core import is_mp3_filename
+from .http_session import get_http_session
+from .lookup_cache import get_lookup_cache, lookup_key
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# MusicBrainz erlaubt eine Anfrage pro Sekunde - gilt für alle gleichzeitig laufenden Album-Erkennungen
+MUSICBRAINZ_MIN_INTERVAL = 1.0
+# Parallel erkannte Verzeichnisse in recognize_albums_from_directories (fpcalc/AcoustID überlappen,
+# MusicBrainz-Anfragen reihen sich über MUSICBRAINZ_MIN_INTERVAL ein)
+ALBUM_BATCH_WORKERS = 4
+
+# Verzeichnisname-Patterns für die einfache Album-Erkennung - einmal beim Import kompiliert
+DIRECTORY_PATTERNS = (
+    re.compile(r'^(.+?)\s*-\s*(.+)$'),  # "Artist - Album"
+    re.compile(r'^(.+?)\s*/\s*(.+)$'),  # "Artist / Album"
+    re.compile(r'^(.+?)\s*_\s*(.+)$'),  # "Artist _ Album"
+)
+
 class AlbumRecognitionService:
     """Service für Album-basierte Erkennung mittels DiscID und AcoustID"""
     
@@ -25,13 +47,53 @@ class AlbumRecognitionService:
         self.acoustid_api_key = "8XaBELgH"  # Öffentlicher API-Key
         self.musicbrainz_base_url = "https://musicbrainz.org/ws/2"
         self.acoustid_base_url = "https://api.acoustid.org/v2"
+        self._mb_lock = threading.Lock()
+        self._mb_last_request = 0.0
+    
+    def _respect_musicbrainz_rate_limit(self):
+        """Hält MUSICBRAINZ_MIN_INTERVAL zwischen zwei Anfragen ein (über alle Threads)"""
+        with self._mb_lock:
+            wait_time = self._mb_last_request + MUSICBRAINZ_MIN_INTERVAL - time.monotonic()
+            if wait_time > 0:
+                time.sleep(wait_time)
+            self._mb_last_request = time.monotonic()
+    
+    def _get_json(self, url, params, timeout):
+        """
+        GET-Anfrage an MusicBrainz/AcoustID mit persistentem Lookup-Cache
         
-    def recognize_album_from_directory(self, directory_path):
+        Returns:
+            dict: JSON-Antwort oder None bei HTTP-Fehlern (Timeouts/Verbindungsfehler werden weitergereicht)
+        """
+        cache = get_lookup_cache()
+        if cache:
+            key = lookup_key(url, params)
+            data = cache.lookup(key)
+            if data is not None:
+                logging.debug(f"💾 Lookup-Cache Treffer: {url}")
+                return data
+        
+        if url.startswith(self.musicbrainz_base_url):
+            self._respect_musicbrainz_rate_limit()
+        response = get_http_session().get(url, params=params, timeout=timeout)
+        if response.status_code != 200:
+            logging.warning(f"❌ HTTP {response.status_code} von {url}")
+            return None
+        
+        data = response.json()
+        # AcoustID meldet Fehler teils mit HTTP 200 und status='error' - die nicht cachen
+        if cache and data.get('status', 'ok') == 'ok':
+            cache.store(key, response.text)
+        return data
+        
+    def recognize_album_from_directory(self, directory_path, files_data=None):
         """
         Erkennt Album-Informationen basierend auf allen MP3-Dateien in einem Verzeichnis
         
         Args:
             directory_path (str): Pfad zum Verzeichnis mit MP3-Dateien
+            files_data (list): Optional bereits gescannte Datei-Datensätze (scan_directory);
+                Track-Längen werden dann daraus übernommen statt jede Datei erneut zu öffnen
             
         Returns:
             dict: Album-Erkennungsergebnisse mit möglichen Kandidaten
@@ -39,58 +101,45 @@ class AlbumRecognitionService:
         try:
             logging.info(f"🎼 Starte Album-Erkennung für Verzeichnis: {directory_path}")
             
-            # Sammle alle MP3-Dateien
-            mp3_files = []
-            for file in os.listdir(directory_path):
-                if file.lower().endswith('.mp3'):
-                    file_path = os.path.join(directory_path, file)
-                    mp3_files.append(file_path)
+            if files_data is not None:
+                track_durations = self._track_durations_from_scan(directory_path, files_data)
+            else:
+                track_durations = self._read_track_durations(directory_path)
             
-            if len(mp3_files) < 2:
+            if track_durations is None:
                 return {
                     'success': False,
                     'error': 'Zu wenige MP3-Dateien für Album-Erkennung (mindestens 2 benötigt)',
                     'candidates': []
                 }
             
-            logging.info(f"📁 Gefunden: {len(mp3_files)} MP3-Dateien")
-            
-            # Extrahiere Track-Informationen (Längen)
-            track_durations = []
-            for file_path in sorted(mp3_files):
-                try:
-                    audio = MP3(file_path)
-                    duration_ms = int(audio.info.length * 1000) if audio.info.length else 0
-                    track_durations.append({
-                        'file': os.path.basename(file_path),
-                        'path': file_path,
-                        'duration_ms': duration_ms
-                    })
-                    logging.debug(f"📊 Track: {os.path.basename(file_path)} - {duration_ms}ms")
-                except Exception as e:
-                    logging.warning(f"Konnte Länge für {file_path} nicht ermitteln: {e}")
-                    continue
-            
             logging.info(f"📊 Extrahierte Tracks: {len(track_durations)}")
             
             # Versuche verschiedene Erkennungsmethoden
             candidates = []
             
-            # Methode 1: Einfacher Verzeichnisname-basierter Ansatz
-            simple_candidates = self._try_simple_directory_recognition(directory_path, track_durations)
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                # Methode 2: AcoustID Album-Lookup (nur bei wenigen Dateien) - fpcalc und AcoustID
+                # laufen parallel zu den MusicBrainz-Suchen, die nacheinander bleiben (max. 1 Anfrage/s)
+                acoustid_future = None
+                if len(track_durations) <= 20:  # Begrenze AcoustID auf kleinere Alben
+                    acoustid_future = executor.submit(self._try_acoustid_album_recognition, track_durations)
+                
+                # Methode 1: Einfacher Verzeichnisname-basierter Ansatz
+                simple_candidates = self._try_simple_directory_recognition(directory_path, track_durations)
+                
+                # Methode 3: MusicBrainz Track-Längen-Matching
+                duration_candidates = self._try_duration_matching(track_durations)
+                
+                acoustid_candidates = acoustid_future.result() if acoustid_future else []
+            
+            # Reihenfolge der Methoden beibehalten - bei gleichem Score gewinnt der erste Kandidat
             if simple_candidates:
                 candidates.extend(simple_candidates)
                 logging.info(f"🔍 Einfache Erkennung: {len(simple_candidates)} Kandidaten")
-            
-            # Methode 2: AcoustID Album-Lookup (nur bei wenigen Dateien)
-            if len(track_durations) <= 20:  # Begrenze AcoustID auf kleinere Alben
-                acoustid_candidates = self._try_acoustid_album_recognition(track_durations)
-                if acoustid_candidates:
-                    candidates.extend(acoustid_candidates)
-                    logging.info(f"🎵 AcoustID: {len(acoustid_candidates)} Kandidaten")
-            
-            # Methode 3: MusicBrainz Track-Längen-Matching
-            duration_candidates = self._try_duration_matching(track_durations)
+            if acoustid_candidates:
+                candidates.extend(acoustid_candidates)
+                logging.info(f"🎵 AcoustID: {len(acoustid_candidates)} Kandidaten")
             if duration_candidates:
                 candidates.extend(duration_candidates)
                 logging.info(f"⏱️ Duration-Matching: {len(duration_candidates)} Kandidaten")
@@ -108,7 +157,7 @@ class AlbumRecognitionService:
                 'method_used': 'combined_album_recognition',
                 'debug_info': {
                     'simple_count': len(simple_candidates) if simple_candidates else 0,
-                    'acoustid_count': len(acoustid_candidates) if len(track_durations) <= 20 and 'acoustid_candidates' in locals() else 0,
+                    'acoustid_count': len(acoustid_candidates),
                     'duration_count': len(duration_candidates) if duration_candidates else 0
                 }
             }
@@ -121,6 +170,85 @@ class AlbumRecognitionService:
                 'candidates': []
             }
     
+    def recognize_albums_from_directories(self, directory_paths, files_data=None, max_workers=ALBUM_BATCH_WORKERS):
+        """
+        Erkennt mehrere Album-Verzeichnisse parallel (z.B. eine ganze Bibliothek)
+        
+        Args:
+            directory_paths (list): Pfade der Album-Verzeichnisse
+            files_data (dict): Optional Verzeichnis -> bereits gescannte Datei-Datensätze
+            max_workers (int): Anzahl gleichzeitig erkannter Verzeichnisse
+            
+        Returns:
+            dict: Verzeichnis -> Ergebnis von recognize_album_from_directory
+        """
+        if not directory_paths:
+            return {}
+        
+        files_data = files_data or {}
+        
+        def recognize(directory_path):
+            return self.recognize_album_from_directory(directory_path, files_data.get(directory_path))
+        
+        # Eine Instanz für alle Verzeichnisse: gemeinsamer Lookup-Cache und MusicBrainz-Rate-Limit
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(directory_paths))) as executor:
+            return dict(zip(directory_paths, executor.map(recognize, directory_paths)))
+    
+    def _read_track_durations(self, directory_path):
+        """Liest die Track-Längen aller MP3s eines Verzeichnisses, None bei weniger als 2 Dateien"""
+        # Sammle alle MP3-Dateien (DirEntry liefert Pfad und Typ ohne extra stat)
+        mp3_files = []
+        with os.scandir(directory_path) as entries:
+            for entry in entries:
+                if is_mp3_filename(entry.name) and entry.is_file():
+                    mp3_files.append(entry.path)
+        
+        if len(mp3_files) < 2:
+            return None
+        
+        logging.info(f"📁 Gefunden: {len(mp3_files)} MP3-Dateien")
+        
+        # Extrahiere Track-Informationen (Längen)
+        track_durations = []
+        for file_path in sorted(mp3_files):
+            try:
+                audio = MP3(file_path)
+                duration_ms = int(audio.info.length * 1000) if audio.info.length else 0
+                track_durations.append({
+                    'file': os.path.basename(file_path),
+                    'path': file_path,
+                    'duration_ms': duration_ms
+                })
+                logging.debug("📊 Track: %s - %sms", os.path.basename(file_path), duration_ms)
+            except Exception as e:
+                logging.warning(f"Konnte Länge für {file_path} nicht ermitteln: {e}")
+                continue
+        
+        return track_durations
+    
+    def _track_durations_from_scan(self, directory_path, files_data):
+        """Track-Längen aus vorhandenen Scan-Datensätzen, None bei weniger als 2 Dateien"""
+        # Nur Dateien direkt im Verzeichnis, wie beim eigenen scandir
+        directory_path = os.path.normpath(directory_path)
+        tracks = sorted(
+            (f for f in files_data if f.get('directory') == directory_path),
+            key=lambda f: f['path']
+        )
+        if len(tracks) < 2:
+            return None
+        
+        logging.info(f"📁 Gefunden: {len(tracks)} MP3-Dateien (aus Scan)")
+        
+        track_durations = []
+        for file_data in tracks:
+            duration = (file_data.get('current_full_tags') or {}).get('duration')
+            track_durations.append({
+                'file': file_data['filename'],
+                'path': file_data['path'],
+                'duration_ms': int(duration * 1000) if duration else 0
+            })
+        return track_durations
+    
     def _try_simple_directory_recognition(self, directory_path, track_durations):
         """Versucht Album-Erkennung basierend auf Verzeichnisname"""
         candidates = []
@@ -131,16 +259,9 @@ class AlbumRecognitionService:
             logging.info(f"🔍 Analysiere Verzeichnisname: '{dir_name}'")
             
             # Verschiedene Verzeichnisname-Patterns
-            patterns = [
-                r'^(.+?)\s*-\s*(.+)$',  # "Artist - Album"
-                r'^(.+?)\s*/\s*(.+)$',  # "Artist / Album"  
-                r'^(.+?)\s*_\s*(.+)$',  # "Artist _ Album"
-            ]
-            
             artist, album = None, None
-            for pattern in patterns:
-                import re
-                match = re.match(pattern, dir_name)
+            for pattern in DIRECTORY_PATTERNS:
+                match = pattern.match(dir_name)
                 if match:
                     artist = match.group(1).strip()
                     album = match.group(2).strip()
@@ -196,10 +317,8 @@ class AlbumRecognitionService:
             
             logging.info(f"🔍 MusicBrainz Suche: {query}")
             
-            response = requests.get(f"{self.musicbrainz_base_url}/release", params=params, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                
+            data = self._get_json(f"{self.musicbrainz_base_url}/release", params, timeout=10)
+            if data:
                 for release in data.get('releases', []):
                     candidate = self._parse_musicbrainz_release(release)
                     if candidate:
@@ -230,23 +349,11 @@ class AlbumRecognitionService:
             elif len(track_durations) == 1:
                 test_tracks = [track_durations[0]]
             
-            for i, track in enumerate(test_tracks):
-                try:
-                    logging.info(f"🔍 Fingerprinting Track {i+1}: {track['file']}")
-                    fingerprint = self._get_acoustid_fingerprint(track['path'])
-                    
-                    if fingerprint:
-                        logging.info(f"✅ Fingerprint erstellt für {track['file']}")
-                        result = self._query_acoustid_with_album_info(fingerprint, track['duration_ms'])
-                        if result:
-                            candidates.extend(result)
-                            logging.info(f"🎵 AcoustID Ergebnisse: {len(result)} für {track['file']}")
-                    else:
-                        logging.warning(f"❌ Kein Fingerprint für {track['file']}")
-                        
-                except Exception as e:
-                    logging.warning(f"AcoustID Fehler für {track['file']}: {e}")
-                    continue
+            # fpcalc läuft als eigener Prozess - beide Tracks gleichzeitig fingerprinten
+            if test_tracks:
+                with ThreadPoolExecutor(max_workers=len(test_tracks)) as executor:
+                    for result in executor.map(self._acoustid_track_candidates, range(1, len(test_tracks) + 1), test_tracks):
+                        candidates.extend(result)
                     
         except Exception as e:
             logging.warning(f"AcoustID Album-Erkennung fehlgeschlagen: {e}")
@@ -254,6 +361,26 @@ class AlbumRecognitionService:
         logging.info(f"🎵 AcoustID Album-Erkennung abgeschlossen: {len(candidates)} Kandidaten")
         return candidates
     
+    def _acoustid_track_candidates(self, number, track):
+        """AcoustID-Kandidaten für einen einzelnen Track (leere Liste bei Fehlern)"""
+        try:
+            logging.info(f"🔍 Fingerprinting Track {number}: {track['file']}")
+            fingerprint = self._get_acoustid_fingerprint(track['path'])
+            
+            if fingerprint:
+                logging.info(f"✅ Fingerprint erstellt für {track['file']}")
+                result = self._query_acoustid_with_album_info(fingerprint, track['duration_ms'])
+                if result:
+                    logging.info(f"🎵 AcoustID Ergebnisse: {len(result)} für {track['file']}")
+                    return result
+            else:
+                logging.warning(f"❌ Kein Fingerprint für {track['file']}")
+                
+        except Exception as e:
+            logging.warning(f"AcoustID Fehler für {track['file']}: {e}")
+        
+        return []
+    
     def _try_duration_matching(self, track_durations):
         """Versucht Album-Erkennung über Track-Längen-Matching"""
         candidates = []
@@ -271,25 +398,23 @@ class AlbumRecognitionService:
             duration_tolerance = 60000  # ±60 Sekunden
             track_tolerance = 2  # ±2 Tracks
             
+            # Eine Anfrage für Track-Bereich und exakte Track-Anzahl - der Boost sortiert exakte Treffer nach vorne
             queries = [
-                f'tracks:{track_count}',  # Exakte Track-Anzahl
-                f'tracks:[{max(1, track_count-track_tolerance)} TO {track_count+track_tolerance}]'  # Track-Bereich
+                f'tracks:{track_count}^2 OR tracks:[{max(1, track_count-track_tolerance)} TO {track_count+track_tolerance}]'
             ]
             
             for query in queries:
                 try:
                     params = {
                         'query': query,
-                        'limit': 10,
+                        'limit': 20,
                         'fmt': 'json'
                     }
                     
                     logging.debug(f"🔍 MusicBrainz Query: {query}")
                     
-                    response = requests.get(f"{self.musicbrainz_base_url}/release", params=params, timeout=15)
-                    if response.status_code == 200:
-                        data = response.json()
-                        
+                    data = self._get_json(f"{self.musicbrainz_base_url}/release", params, timeout=15)
+                    if data:
                         for release in data.get('releases', []):
                             candidate = self._parse_musicbrainz_release(release)
                             if candidate:
@@ -297,9 +422,7 @@ class AlbumRecognitionService:
                                 candidate['match_score'] = 0.6  # Base score für Duration-Matching
                                 candidate['method'] = 'duration_matching'
                                 candidates.append(candidate)
-                                logging.debug(f"⏱️ Duration Kandidat: {candidate.get('album')} ({candidate.get('track_count')} tracks)")
-                    else:
-                        logging.warning(f"❌ MusicBrainz HTTP {response.status_code} für Query: {query}")
+                                logging.debug("⏱️ Duration Kandidat: %s (%s tracks)", candidate.get('album'), candidate.get('track_count'))
                         
                 except requests.exceptions.Timeout:
                     logging.warning(f"⏰ MusicBrainz Timeout für Query: {query}")
@@ -354,11 +477,9 @@ class AlbumRecognitionService:
             
             logging.debug(f"🌐 AcoustID Query: duration={duration//1000}s")
             
-            response = requests.get(f"{self.acoustid_base_url}/lookup", params=params, timeout=15)
+            data = self._get_json(f"{self.acoustid_base_url}/lookup", params, timeout=15)
             
-            if response.status_code == 200:
-                data = response.json()
-                
+            if data:
                 if data.get('status') != 'ok':
                     logging.warning(f"❌ AcoustID API Status: {data.get('status')}")
                     return []
@@ -376,14 +497,12 @@ class AlbumRecognitionService:
                                 candidate = self._parse_acoustid_release(release, recording)
                                 if candidate:
                                     candidates.append(candidate)
-                                    logging.debug(f"🎵 AcoustID Kandidat: {candidate.get('album')} von {candidate.get('artist')}")
+                                    logging.debug("🎵 AcoustID Kandidat: %s von %s", candidate.get('album'), candidate.get('artist'))
                     except Exception as e:
                         logging.warning(f"Fehler beim Parsen von AcoustID Ergebnis: {e}")
                         continue
                 
                 return candidates
-            else:
-                logging.warning(f"❌ AcoustID API Fehler: HTTP {response.status_code}")
                 
         except requests.exceptions.Timeout:
             logging.error(f"⏰ AcoustID API Timeout")
@@ -505,8 +624,8 @@ class AudioFingerprintService:
     def audio_recognition(self):
         """Lazy loading für AudioRecognitionService"""
         if self._audio_recognition is None:
-            from .audio_recognition import AudioRecognitionService
-            self._audio_recognition = AudioRecognitionService()
+            from .audio_recognition import get_recognition_service
+            self._audio_recognition = get_recognition_service()
         return self._audio_recognition
         
     def get_audio_fingerprint_metadata(self, file_path):
@@ -607,11 +726,9 @@ class AudioFingerprintService:
     def _calculate_fingerprint_similarity(self, fp1, fp2):
         """Berechnet Ähnlichkeit zwischen zwei Fingerprints (vereinfacht)"""
         try:
-            # Vereinfachter Vergleich basierend auf String-Ähnlichkeit
-            from difflib import SequenceMatcher
-            
-            matcher = SequenceMatcher(None, fp1, fp2)
-            return matcher.ratio()
+            # Vereinfachter Vergleich basierend auf String-Ähnlichkeit - die Fingerprints sind
+            # mehrere KB lang, difflib wäre hier quadratisch in Python, RapidFuzz rechnet in C++
+            return fuzz.ratio(fp1, fp2) / 100
             
         except Exception:
             return 0.0
@@ -715,6 +832,32 @@ class AudioFingerprintService:
             logging.error(f"Fehler beim Löschen der temporären Datei: {str(e)}")
 
 
+@lru_cache(maxsize=1)
+def get_fingerprint_service():
+    """Liefert die prozessweit gemeinsame AudioFingerprintService-Instanz"""
+    return AudioFingerprintService()
+
+
+@lru_cache(maxsize=1)
+def get_album_recognition_service():
+    """Liefert die prozessweit gemeinsame AlbumRecognitionService-Instanz"""
+    return AlbumRecognitionService()
+
+
+def recognize_albums(directory_paths):
+    """
+    Standalone-Funktion für die Album-Erkennung mehrerer Verzeichnisse
+    
+    Args:
+        directory_paths (list): Pfade der Album-Verzeichnisse
+        
+    Returns:
+        dict: Verzeichnis -> Album-Erkennungsergebnis
+    """
+    service = get_album_recognition_service()
+    return service.recognize_albums_from_directories(directory_paths)
+
+
 def get_audio_fingerprint_metadata(file_path):
     """
     Standalone-Funktion für Audio-Fingerprinting Metadaten
@@ -725,7 +868,7 @@ def get_audio_fingerprint_metadata(file_path):
     Returns:
         dict: Gefundene Metadaten oder None
     """
-    service = AudioFingerprintService()
+    service = get_fingerprint_service()
     return service.get_audio_fingerprint_metadata(file_path)
 
 
@@ -739,7 +882,7 @@ def create_audio_fingerprint(file_path):
     Returns:
         dict: Fingerprint-Daten oder None
     """
-    service = AudioFingerprintService()
+    service = get_fingerprint_service()
     return service.create_audio_fingerprint(file_path)
 
 
@@ -754,7 +897,7 @@ def compare_audio_files(file_path1, file_path2):
     Returns:
         dict: Vergleichsergebnis oder None
     """
-    service = AudioFingerprintService()
+    service = get_fingerprint_service()
     return service.compare_audio_fingerprints(file_path1, file_path2)
 
 
@@ -768,5 +911,5 @@ def extract_audio_features(file_path):
     Returns:
         dict: Audio-Features oder None
     """
-    service = AudioFingerprintService()
+    service = get_fingerprint_service()
     return service.extract_audio_features(file_path)
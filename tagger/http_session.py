@@ -0,0 +1,32 @@
+"""
+HTTP Session Module
+Gemeinsame requests-Session mit Connection-Pooling für alle Online-Dienste
+"""
+
+from functools import lru_cache
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Keep-Alive-Verbindungen je Host (MusicBrainz, AcoustID, Cover-Archive, CDNs)
+HTTP_POOL_CONNECTIONS = 16
+HTTP_POOL_MAXSIZE = 32
+
+
+@lru_cache(maxsize=1)
+def get_http_session():
+    """
+    Liefert die prozessweit gemeinsame requests-Session
+
+    Wiederverwendete TCP/TLS-Verbindungen sparen pro Anfrage den Verbindungsaufbau;
+    Verbindungsfehler und 502/503/504 werden zweimal mit kurzem Backoff wiederholt.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504), raise_on_status=False)
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
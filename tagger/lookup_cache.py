@@ -0,0 +1,100 @@
+"""
+Lookup Cache Module
+Persistenter SQLite-Cache für Antworten der Online-Dienste (MusicBrainz/AcoustID) bei der Album-Erkennung
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from functools import lru_cache
+
+# Release-Daten ändern sich selten - Antworten 30 Tage wiederverwenden
+LOOKUP_TTL = 30 * 24 * 3600
+
+
+def lookup_key(url, params):
+    """
+    Stabiler Schlüssel für eine Anfrage aus URL und Parametern
+
+    Über blake2b statt hash(), damit der Schlüssel über Neustarts und Prozesse hinweg gleich bleibt.
+    """
+    payload = json.dumps([url, sorted(params.items())], ensure_ascii=False)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+class LookupCache:
+    """
+    Speichert die JSON-Antworten erfolgreicher Anfragen pro Schlüssel
+
+    Wiederholte Album-Erkennungen (auch nach einem Neustart) und die für
+    jede Track-Anzahl identischen Duration-Abfragen gehen so nicht erneut
+    übers Netz.
+    """
+
+    def __init__(self, db_path, ttl=LOOKUP_TTL):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, fetched_at REAL NOT NULL, body TEXT NOT NULL)'
+        )
+        self._conn.commit()
+
+    def lookup(self, key):
+        """
+        Liefert die gespeicherte Antwort, solange sie jünger als die TTL ist
+
+        Args:
+            key (str): Ergebnis von lookup_key()
+
+        Returns:
+            dict: Dekodierte JSON-Antwort oder None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT body FROM responses WHERE key = ? AND fetched_at >= ?', (key, time.time() - self._ttl)
+            ).fetchone()
+        if row:
+            try:
+                return json.loads(row[0])
+            except ValueError as e:
+                logging.warning(f"Ungültiger Lookup-Cache-Eintrag {key}: {str(e)}")
+        return None
+
+    def store(self, key, body):
+        """
+        Speichert eine Antwort
+
+        Args:
+            key (str): Ergebnis von lookup_key()
+            body (str): JSON-Text der Antwort
+        """
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?)', (key, time.time(), body))
+
+
+@lru_cache(maxsize=1)
+def get_lookup_cache():
+    """
+    Liefert den prozessweit gemeinsamen LookupCache oder None
+
+    Pfad über MP3_LOOKUP_CACHE_DB (Standard: ~/.mp3tagger/lookup_cache.db),
+    ein leerer Wert schaltet den Cache ab.
+    """
+    db_path = os.getenv('MP3_LOOKUP_CACHE_DB', os.path.join('~', '.mp3tagger', 'lookup_cache.db'))
+    if not db_path:
+        return None
+
+    try:
+        return LookupCache(os.path.expanduser(db_path))
+    except (OSError, sqlite3.Error) as e:
+        logging.warning(f"Lookup-Cache nicht verfügbar ({db_path}): {str(e)}")
+        return None
@@ -5,18 +5,47 @@ Modul für die Anreicherung von MP3-Dateien mit erweiterten Metadaten
 
 import logging
 import asyncio
-from .online_metadata import OnlineMetadataProvider
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from .online_metadata import get_metadata_provider
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# Parallele Online-Anreicherungen über alle Requests (Rate Limits je Dienst gelten weiterhin prozessweit)
+ENRICH_WORKERS = 16
+
+# Ein gemeinsamer Pool - gleichzeitige Seitenaufrufe stapeln keine eigenen Worker
+_enrich_executor = ThreadPoolExecutor(max_workers=ENRICH_WORKERS, thread_name_prefix='enrich')
+
+
+class MetadataPrefetch:
+    """Im Hintergrund laufende Anreicherungen einer Ergebnisseite"""
+    
+    def __init__(self, service, pending):
+        self._service = service
+        self._pending = pending
+    
+    def __call__(self, file_data):
+        """Angereichertes Ergebnis zu einem Eintrag (wartet nur, falls es noch nicht fertig ist)"""
+        future = self._pending.get(file_data['path'])
+        if future is None:
+            return self._service.enrich_file_metadata(file_data)
+        return future.result()
+    
+    def cancel(self):
+        """Verwirft noch nicht gestartete Anreicherungen, z.B. wenn der Browser die Seite abbricht"""
+        for future in self._pending.values():
+            future.cancel()
+
+
 class MetadataEnrichmentService:
     """Service für die intelligente Anreicherung von Metadaten"""
     
     def __init__(self):
-        self.online_provider = OnlineMetadataProvider()
+        self.online_provider = get_metadata_provider()
         # Lazy imports um zirkuläre Abhängigkeiten zu vermeiden
         self._audio_recognition = None
         self._fingerprint_service = None
@@ -25,16 +54,16 @@ class MetadataEnrichmentService:
     def audio_recognition(self):
         """Lazy loading für AudioRecognitionService"""
         if self._audio_recognition is None:
-            from .audio_recognition import AudioRecognitionService
-            self._audio_recognition = AudioRecognitionService()
+            from .audio_recognition import get_recognition_service
+            self._audio_recognition = get_recognition_service()
         return self._audio_recognition
         
     @property
     def fingerprint_service(self):
         """Lazy loading für AudioFingerprintService"""
         if self._fingerprint_service is None:
-            from .fingerprinting import AudioFingerprintService
-            self._fingerprint_service = AudioFingerprintService()
+            from .fingerprinting import get_fingerprint_service
+            self._fingerprint_service = get_fingerprint_service()
         return self._fingerprint_service
         
     def enrich_file_metadata(self, file_data):
@@ -48,6 +77,20 @@ class MetadataEnrichmentService:
             dict: Angereicherte Dateiinformationen
         """
         try:
+            # Bereits bestätigte, seitdem unveränderte Datei braucht keine Online-Suche
+            confirmed = self.audio_recognition.confirmed_metadata(file_data['path'])
+            if confirmed:
+                logging.info(f"✅ Bestätigte Tags aus lokalem Cache für: {file_data['filename']}")
+                file_data.update({
+                    'suggested_artist': confirmed.get('artist'),
+                    'suggested_title': confirmed.get('title'),
+                    'suggested_album': confirmed.get('album'),
+                    'suggested_genre': confirmed.get('genre'),
+                    'suggested_cover_url': confirmed.get('cover_url'),
+                    'suggested_full_tags': confirmed
+                })
+                return file_data
+            
             # Prüfe ob bereits grundlegende Informationen vorhanden sind
             has_basic_info = (
                 file_data['current_artist'] and 
@@ -107,13 +150,29 @@ class MetadataEnrichmentService:
         Returns:
             list: Liste angereicherte Dateiinformationen
         """
-        results = []
+        if not files_data:
+            return []
         
-        for file_data in files_data:
-            enriched_file = self.enrich_file_metadata(file_data)
-            results.append(enriched_file)
+        # Netzwerk-Latenzen der einzelnen Dateien überlappen, Reihenfolge bleibt erhalten
+        return list(_enrich_executor.map(self.enrich_file_metadata, files_data))
+    
+    def prefetch_file_metadata(self, files_data):
+        """
+        Startet die Anreicherung aller Dateien im Hintergrund
+        
+        Args:
+            files_data (list): Liste von Dateiinformationen in Anzeigereihenfolge
             
-        return results
+        Returns:
+            MetadataPrefetch: Liefert zu einem Eintrag aus files_data das angereicherte Ergebnis;
+                cancel() verwirft die noch wartenden Anreicherungen
+        """
+        # Schlüssel ist der Pfad - auch kopierte oder neu gruppierte Einträge finden ihr Ergebnis
+        pending = {
+            file_data['path']: _enrich_executor.submit(self.enrich_file_metadata, file_data)
+            for file_data in files_data
+        }
+        return MetadataPrefetch(self, pending)
     
     def _get_fallback_metadata(self, file_data):
         """
@@ -200,6 +259,17 @@ class MetadataEnrichmentService:
         return False
 
 
+@lru_cache(maxsize=1)
+def get_enrichment_service():
+    """
+    Liefert die prozessweit gemeinsame MetadataEnrichmentService-Instanz
+    
+    Online-Provider und Erkennungsdienste samt HTTP-Verbindungen werden so
+    von allen parallelen Anreicherungen geteilt.
+    """
+    return MetadataEnrichmentService()
+
+
 def enrich_file_metadata(file_data):
     """
     Standalone-Funktion für die Anreicherung einer einzelnen Datei
@@ -210,8 +280,7 @@ def enrich_file_metadata(file_data):
     Returns:
         dict: Angereicherte Dateiinformationen
     """
-    service = MetadataEnrichmentService()
-    return service.enrich_file_metadata(file_data)
+    return get_enrichment_service().enrich_file_metadata(file_data)
 
 
 def enrich_multiple_files(files_data):
@@ -224,5 +293,4 @@ def enrich_multiple_files(files_data):
     Returns:
         list: Liste angereicherte Dateiinformationen
     """
-    service = MetadataEnrichmentService()
-    return service.enrich_multiple_files(files_data)
+    return get_enrichment_service().enrich_multiple_files(files_data)
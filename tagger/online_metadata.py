@@ -1,23 +1,98 @@
 import os
+import hashlib
 import logging
-import requests
+import tempfile
 import time
 import re
+import threading
+from functools import lru_cache
 from urllib.parse import quote
 from dotenv import load_dotenv
 from pathlib import Path
 import musicbrainzngs
 import pylast
 import discogs_client
+from rapidfuzz import fuzz
 import base64
 from io import BytesIO
 from PIL import Image
+from .http_session import get_http_session
 
 # Lade Umgebungsvariablen
 from pathlib import Path
 config_path = Path(__file__).parent.parent / 'config.env'
 load_dotenv(config_path)
 
+# Heruntergeladene Cover, adressiert über den SHA-1 der URL (MP3_COVER_DOWNLOAD_DIR, leer = aus)
+COVER_DOWNLOAD_DIR = os.path.expanduser(os.getenv('MP3_COVER_DOWNLOAD_DIR', os.path.join('~', '.mp3tagger', 'covers')))
+
+
+def fetch_cover_bytes(url, timeout=10):
+    """
+    Lädt ein Cover-Bild, wiederholte Abrufe derselben URL kommen von der Platte
+
+    Cover-URLs der Dienste sind stabil - benachbarte Titel eines Albums teilen sich
+    dieselbe URL, nur der erste Abruf geht übers Netz.
+
+    Returns:
+        bytes: Bilddaten
+
+    Raises:
+        requests.RequestException: Download fehlgeschlagen
+    """
+    path = None
+    if COVER_DOWNLOAD_DIR:
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        path = os.path.join(COVER_DOWNLOAD_DIR, digest[:2], digest)
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            pass
+
+    response = get_http_session().get(url, timeout=timeout)
+    response.raise_for_status()
+    data = response.content
+
+    if path:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Über eine temporäre Datei, damit parallele Abrufe nie ein halbes Bild lesen
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.cover-')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            logging.warning(f"Cover nicht im Download-Cache gespeichert ({path}): {str(e)}")
+    return data
+
+
+# Release-, Release-Group-, Artist- und Cover-Abfragen wiederholen sich für alle Titel eines Albums
+# (und für Geschwister-Verzeichnisse) - prozessweit nach ID gecacht, die Antworten werden nur gelesen
+MB_DETAIL_CACHE_SIZE = 2048
+
+
+@lru_cache(maxsize=MB_DETAIL_CACHE_SIZE)
+def _mb_entity(kind, entity_id, includes=()):
+    """musicbrainzngs.get_<kind>_by_id mit Cache, z.B. _mb_entity('release', id, ('release-groups',))"""
+    return getattr(musicbrainzngs, f'get_{kind}_by_id')(entity_id, includes=list(includes))
+
+
+@lru_cache(maxsize=MB_DETAIL_CACHE_SIZE)
+def _mb_image_list(release_id):
+    """Cover-Art-Archiv-Einträge eines Releases mit Cache - auch 'kein Cover' (404) wird gemerkt"""
+    try:
+        return musicbrainzngs.get_image_list(release_id)
+    except musicbrainzngs.ResponseError as e:
+        if getattr(e.cause, 'code', None) == 404:
+            return {}
+        raise
+
+
 class OnlineMetadataProvider:
     """
     Sammelt Metadaten von verschiedenen Online-Diensten:
@@ -35,6 +110,7 @@ class OnlineMetadataProvider:
             'discogs': 1.0       # 1 Request pro Sekunde
         }
         self.last_request = {}
+        self._rate_lock = threading.Lock()
         
     def _setup_apis(self):
         """Initialisiert alle API-Clients"""
@@ -63,14 +139,16 @@ class OnlineMetadataProvider:
     
     def _respect_rate_limit(self, service):
         """Berücksichtigt Rate Limits der APIs"""
-        if service in self.last_request:
-            elapsed = time.time() - self.last_request[service]
-            required_wait = self.rate_limits[service]
-            if elapsed < required_wait:
-                wait_time = required_wait - elapsed
-                time.sleep(wait_time)
-        
-        self.last_request[service] = time.time()
+        # Die Instanz wird von allen Request-Threads geteilt
+        with self._rate_lock:
+            if service in self.last_request:
+                elapsed = time.time() - self.last_request[service]
+                required_wait = self.rate_limits[service]
+                if elapsed < required_wait:
+                    wait_time = required_wait - elapsed
+                    time.sleep(wait_time)
+            
+            self.last_request[service] = time.time()
     
     def search_metadata(self, filename, current_artist=None, current_title=None, current_album=None):
         """
@@ -151,6 +229,10 @@ class OnlineMetadataProvider:
                     if not title:
                         search_info['title'] = parts[1].strip()
         
+        # Normalisierte Vergleichswerte einmal pro Suche statt pro Kandidat
+        for key in ('artist', 'title', 'album'):
+            search_info[f'{key}_norm'] = (search_info[key] or '').lower().strip()
+        
         return search_info
     
     def _search_musicbrainz(self, search_info):
@@ -158,20 +240,15 @@ class OnlineMetadataProvider:
         try:
             self._respect_rate_limit('musicbrainz')
             
-            # Erste Suche mit Album
+            # Eine Anfrage statt Suche mit Album plus Fallback ohne Album: das Album ist optional
+            # (OR mit der ohnehin geforderten Aufnahme) und bringt passende Releases per Boost nach vorne
             query = f'artist:"{search_info["artist"]}" AND recording:"{search_info["title"]}"'
             if search_info['album']:
-                query += f' AND release:"{search_info["album"]}"'
+                query += f' AND (release:"{search_info["album"]}"^2 OR recording:"{search_info["title"]}")'
             
             self.logger.info(f"MusicBrainz Query: {query}")
             result = musicbrainzngs.search_recordings(query=query, limit=5)
             
-            # Falls keine Ergebnisse mit Album, versuche ohne Album
-            if not result['recording-list'] and search_info['album']:
-                query_fallback = f'artist:"{search_info["artist"]}" AND recording:"{search_info["title"]}"'
-                self.logger.info(f"MusicBrainz Fallback Query (ohne Album): {query_fallback}")
-                result = musicbrainzngs.search_recordings(query=query_fallback, limit=5)
-            
             if result['recording-list']:
                 best_match = result['recording-list'][0]
                 self.logger.info(f"MusicBrainz gefunden: {best_match.get('title')} von {best_match.get('artist-credit', [{}])[0].get('artist', {}).get('name', 'Unknown')}")
@@ -192,10 +269,10 @@ class OnlineMetadataProvider:
                         for release in best_match['release-list'][:3]:  # Erste 3 Releases
                             release_id = release['id']
                             release_title = release.get('title', 'Unknown')
-                            self.logger.debug(f"Suche Cover in Release: {release_title} ({release_id})")
+                            self.logger.debug("Suche Cover in Release: %s (%s)", release_title, release_id)
                             
                             try:
-                                cover_art = musicbrainzngs.get_image_list(release_id)
+                                cover_art = _mb_image_list(release_id)
                                 if cover_art.get('images'):
                                     # Nimm das erste Front-Cover
                                     for image in cover_art['images']:
@@ -218,12 +295,12 @@ class OnlineMetadataProvider:
                                 self.logger.debug(f"Cover-Art Fehler für {release_title}: {cover_e}")
                                 
                         # Hole Release-Details für Genre-Informationen (erstes Release)
-                        release_detail = musicbrainzngs.get_release_by_id(best_match['release-list'][0]['id'], includes=['release-groups'])
+                        release_detail = _mb_entity('release', best_match['release-list'][0]['id'], ('release-groups',))
                         
                         if 'release-group' in release_detail['release']:
                             rg_id = release_detail['release']['release-group']['id']
                             self.logger.debug(f"Hole Release-Group-Tags für {rg_id}")
-                            rg_detail = musicbrainzngs.get_release_group_by_id(rg_id, includes=['tags'])
+                            rg_detail = _mb_entity('release_group', rg_id, ('tags',))
                             if 'tag-list' in rg_detail['release-group']:
                                 self.logger.debug(f"Release-Group hat {len(rg_detail['release-group']['tag-list'])} Tags")
                                 for tag in rg_detail['release-group']['tag-list']:
@@ -233,32 +310,36 @@ class OnlineMetadataProvider:
                                         count_int = int(count) if isinstance(count, str) else count
                                         if count_int > 0:  # Nur Tags mit Bewertungen
                                             genres.append(tag['name'])
-                                            self.logger.debug(f"Genre hinzugefügt: {tag['name']} (count: {count})")
+                                            self.logger.debug("Genre hinzugefügt: %s (count: %s)", tag['name'], count)
                                     except (ValueError, TypeError):
                                         # Auch Tags ohne gültigen Count verwenden
                                         genres.append(tag['name'])
-                                        self.logger.debug(f"Genre hinzugefügt (ohne Count): {tag['name']}")
+                                        self.logger.debug("Genre hinzugefügt (ohne Count): %s", tag['name'])
                     
                     # Versuche auch Artist-Genres
                     if best_match.get('artist-credit'):
                         artist_id = best_match['artist-credit'][0]['artist']['id']
                         self.logger.debug(f"Hole Artist-Tags für {artist_id}")
-                        artist_detail = musicbrainzngs.get_artist_by_id(artist_id, includes=['tags'])
+                        artist_detail = _mb_entity('artist', artist_id, ('tags',))
                         if 'tag-list' in artist_detail['artist']:
                             self.logger.debug(f"Artist hat {len(artist_detail['artist']['tag-list'])} Tags")
+                            # Set für die Duplikatprüfung statt linearer Suche in genres je Tag
+                            seen_genres = set(genres)
                             for tag in artist_detail['artist']['tag-list']:
                                 # Count kann String oder Int sein - beide behandeln
                                 count = tag.get('count', 0)
                                 try:
                                     count_int = int(count) if isinstance(count, str) else count
-                                    if count_int > 0 and tag['name'] not in genres:
+                                    if count_int > 0 and tag['name'] not in seen_genres:
                                         genres.append(tag['name'])
-                                        self.logger.debug(f"Artist-Genre hinzugefügt: {tag['name']} (count: {count})")
+                                        seen_genres.add(tag['name'])
+                                        self.logger.debug("Artist-Genre hinzugefügt: %s (count: %s)", tag['name'], count)
                                 except (ValueError, TypeError):
                                     # Auch Tags ohne gültigen Count verwenden
-                                    if tag['name'] not in genres:
+                                    if tag['name'] not in seen_genres:
                                         genres.append(tag['name'])
-                                        self.logger.debug(f"Artist-Genre hinzugefügt (ohne Count): {tag['name']}")
+                                        seen_genres.add(tag['name'])
+                                        self.logger.debug("Artist-Genre hinzugefügt (ohne Count): %s", tag['name'])
                         else:
                             self.logger.debug("Keine Artist-Tags gefunden")
                                     
@@ -472,20 +553,19 @@ class OnlineMetadataProvider:
     
     def _calculate_confidence(self, search_info, found_artist, found_title, found_album):
         """Berechnet Vertrauenswert basierend auf String-Ähnlichkeit"""
-        from difflib import SequenceMatcher
-        
+        # RapidFuzz (C++) statt difflib - läuft pro Kandidat und Feld, Ergebnis 0-100
         scores = []
         
         if search_info['artist'] and found_artist:
-            score = SequenceMatcher(None, search_info['artist'].lower(), found_artist.lower()).ratio()
+            score = fuzz.ratio(search_info['artist_norm'], found_artist.lower().strip()) / 100
             scores.append(score)
         
         if search_info['title'] and found_title:
-            score = SequenceMatcher(None, search_info['title'].lower(), found_title.lower()).ratio()
+            score = fuzz.ratio(search_info['title_norm'], found_title.lower().strip()) / 100
             scores.append(score)
         
         if search_info['album'] and found_album:
-            score = SequenceMatcher(None, search_info['album'].lower(), found_album.lower()).ratio()
+            score = fuzz.ratio(search_info['album_norm'], found_album.lower().strip()) / 100
             scores.append(score)
         
         return sum(scores) / len(scores) if scores else 0.0
@@ -504,11 +584,8 @@ class OnlineMetadataProvider:
     def download_cover_art(self, cover_url, max_size=(500, 500)):
         """Lädt Cover-Art herunter und konvertiert zu Base64"""
         try:
-            response = requests.get(cover_url, timeout=10)
-            response.raise_for_status()
-            
-            # Lade Bild und skaliere falls nötig
-            img = Image.open(BytesIO(response.content))
+            # Lade Bild (lokal aus dem Download-Cache, falls schon abgerufen) und skaliere falls nötig
+            img = Image.open(BytesIO(fetch_cover_bytes(cover_url)))
             
             # Skaliere auf maximale Größe
             img.thumbnail(max_size, Image.Resampling.LANCZOS)
@@ -540,8 +617,8 @@ class OnlineMetadataProvider:
             'tempo_description': None
         }
         
-        # Kombiniere alle verfügbaren Tags für die Analyse
-        all_tags = genres.copy() if genres else []
+        # Kombiniere alle verfügbaren Tags für die Analyse (einmal normalisiert - Keywords sind bereits klein geschrieben)
+        all_tags = [tag.lower() for tag in genres] if genres else []
         
         # Zeitliche Einordnung basierend auf Jahr und Genre
         year = self._extract_year_from_mb(musicbrainz_data)
@@ -579,7 +656,7 @@ class OnlineMetadataProvider:
         
         for mood, keywords in mood_keywords.items():
             for keyword in keywords:
-                if any(keyword.lower() in tag.lower() for tag in all_tags):
+                if any(keyword in tag for tag in all_tags):
                     if mood not in classification['mood']:
                         classification['mood'].append(mood)
         
@@ -599,7 +676,7 @@ class OnlineMetadataProvider:
         
         for style, keywords in style_keywords.items():
             for keyword in keywords:
-                if any(keyword.lower() in tag.lower() for tag in all_tags):
+                if any(keyword in tag for tag in all_tags):
                     if style not in classification['style']:
                         classification['style'].append(style)
         
@@ -617,7 +694,7 @@ class OnlineMetadataProvider:
         
         for instr, keywords in instrumentation_keywords.items():
             for keyword in keywords:
-                if any(keyword.lower() in tag.lower() for tag in all_tags):
+                if any(keyword in tag for tag in all_tags):
                     if instr not in classification['instrumentation']:
                         classification['instrumentation'].append(instr)
         
@@ -630,7 +707,7 @@ class OnlineMetadataProvider:
         
         for energy, keywords in energy_mapping.items():
             for keyword in keywords:
-                if any(keyword.lower() in tag.lower() for tag in all_tags):
+                if any(keyword in tag for tag in all_tags):
                     classification['energy_level'] = energy
                     break
             if classification['energy_level']:
@@ -647,7 +724,7 @@ class OnlineMetadataProvider:
         
         for tempo, keywords in tempo_mapping.items():
             for keyword in keywords:
-                if any(keyword.lower() in tag.lower() for tag in all_tags):
+                if any(keyword in tag for tag in all_tags):
                     classification['tempo_description'] = tempo
                     break
             if classification['tempo_description']:
@@ -669,7 +746,7 @@ class OnlineMetadataProvider:
         
         for artist, keywords in similarity_mapping.items():
             for keyword in keywords:
-                if any(keyword.lower() in tag.lower() for tag in all_tags):
+                if any(keyword in tag for tag in all_tags):
                     similarity = f"similar to {artist.title()}"
                     if similarity not in classification['similar_artists']:
                         classification['similar_artists'].append(similarity)
@@ -731,9 +808,12 @@ class OnlineMetadataProvider:
             combined_genres.extend(lastfm_result['additional_genres'][:3])  # Top 3 von Last.fm
         if mb_result.get('additional_genres'):
             # Füge MusicBrainz Genres hinzu, die nicht schon vorhanden sind
+            # (kleingeschriebene Namen einmal als Set, statt die Liste pro Genre neu aufzubauen)
+            seen_genres = {g.lower() for g in combined_genres}
             for genre in mb_result['additional_genres'][:3]:
-                if genre.lower() not in [g.lower() for g in combined_genres]:
+                if genre.lower() not in seen_genres:
                     combined_genres.append(genre)
+                    seen_genres.add(genre.lower())
         
         combined['additional_genres'] = combined_genres[:6]  # Max 6 Genres
         combined['genre'] = combined_genres[0] if combined_genres else primary.get('genre')
@@ -758,3 +838,14 @@ class OnlineMetadataProvider:
         logging.info(f"Kombinierte Ergebnisse: {primary_source} (conf={primary['confidence']:.2f}) + {secondary_source} (conf={secondary['confidence']:.2f}) = {combined['source']}")
         
         return combined
+
+
+@lru_cache(maxsize=1)
+def get_metadata_provider():
+    """
+    Liefert die prozessweit gemeinsame OnlineMetadataProvider-Instanz
+    
+    API-Clients werden nur einmal eingerichtet und die Rate Limits gelten
+    über alle Requests hinweg.
+    """
+    return OnlineMetadataProvider()
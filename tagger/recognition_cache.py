@@ -0,0 +1,150 @@
+"""
+Recognition Cache Module
+Persistenter SQLite-Cache für Audio-Erkennungen, Schlüssel ist der Chromaprint-Fingerprint
+"""
+
+import os
+import hashlib
+import logging
+import sqlite3
+import threading
+from functools import lru_cache
+
+# Gespeicherte Felder eines Erkennungsergebnisses (raw_data der Dienste wird nicht gehalten)
+RESULT_FIELDS = ('service', 'artist', 'title', 'album', 'genre', 'cover_url', 'confidence')
+
+
+def fingerprint_hash(fingerprint):
+    """Kurzer, fester Schlüssel für einen (mehrere KB langen) Chromaprint-Fingerprint"""
+    return hashlib.blake2b(fingerprint.encode(), digest_size=16).hexdigest()
+
+
+class RecognitionCache:
+    """
+    Speichert erfolgreiche Erkennungen pro Fingerprint
+
+    Identisches Audio (auch als Kopie unter anderem Pfad oder mit geänderten
+    Tags) wird so ohne erneute Anfrage an ShazamIO/AcoustID erkannt.
+    """
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS fingerprints ('
+            'fp_hash TEXT PRIMARY KEY, service TEXT, artist TEXT, title TEXT, album TEXT, '
+            'genre TEXT, cover_url TEXT, confidence REAL, user_confirmed INTEGER NOT NULL DEFAULT 0)'
+        )
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(fingerprints)')}
+        if 'user_confirmed' not in columns:
+            # Bestehende Cache-Datenbank aus der Zeit vor der Bestätigung erweitern
+            self._conn.execute('ALTER TABLE fingerprints ADD COLUMN user_confirmed INTEGER NOT NULL DEFAULT 0')
+        # Bestätigte Dateien je Pfad mit mtime/Größe - die Anreicherung findet sie ohne fpcalc-Lauf
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS confirmed_files ('
+            'path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, fp_hash TEXT NOT NULL)'
+        )
+        self._conn.commit()
+
+    def lookup(self, fp_hash, confirmed_only=False):
+        """
+        Liefert die gespeicherte Erkennung zu einem Fingerprint
+
+        Args:
+            fp_hash (str): Ergebnis von fingerprint_hash()
+            confirmed_only (bool): Nur vom Benutzer bestätigte (geschriebene) Tags
+
+        Returns:
+            dict: Erkennungsergebnis oder None
+        """
+        query = f'SELECT {", ".join(RESULT_FIELDS)} FROM fingerprints WHERE fp_hash = ?'
+        if confirmed_only:
+            query += ' AND user_confirmed = 1'
+        with self._lock:
+            row = self._conn.execute(query, (fp_hash,)).fetchone()
+        return dict(zip(RESULT_FIELDS, row)) if row else None
+
+    def lookup_confirmed_file(self, path, stat_key):
+        """
+        Liefert die bestätigte Erkennung einer unveränderten Datei
+
+        Args:
+            path (str): Pfad der MP3-Datei
+            stat_key (tuple): (mtime_ns, size) der Datei
+
+        Returns:
+            dict: Erkennungsergebnis oder None (auch wenn die Datei seit der Bestätigung geändert wurde)
+        """
+        with self._lock:
+            row = self._conn.execute(
+                f'SELECT {", ".join(f"f.{field}" for field in RESULT_FIELDS)} '
+                'FROM confirmed_files c JOIN fingerprints f ON f.fp_hash = c.fp_hash '
+                'WHERE c.path = ? AND c.mtime_ns = ? AND c.size = ? AND f.user_confirmed = 1',
+                (path, *stat_key)
+            ).fetchone()
+        return dict(zip(RESULT_FIELDS, row)) if row else None
+
+    def store(self, fp_hash, result):
+        """
+        Speichert ein Erkennungsergebnis (eine vorhandene Bestätigung bleibt erhalten)
+
+        Args:
+            fp_hash (str): Ergebnis von fingerprint_hash()
+            result (dict): Ergebnis von ShazamIO/AcoustID
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                f'INSERT INTO fingerprints (fp_hash, {", ".join(RESULT_FIELDS)}) '
+                f'VALUES (?, {", ".join("?" * len(RESULT_FIELDS))}) '
+                f'ON CONFLICT(fp_hash) DO UPDATE SET '
+                f'{", ".join(f"{field} = excluded.{field}" for field in RESULT_FIELDS)} '
+                f'WHERE user_confirmed = 0',
+                (fp_hash, *(result.get(field) for field in RESULT_FIELDS))
+            )
+
+    def confirm(self, fp_hash, artist, title, album=None, path=None, stat_key=None):
+        """
+        Merkt die vom Benutzer geschriebenen Tags als bestätigte Erkennung
+
+        Args:
+            fp_hash (str): Ergebnis von fingerprint_hash()
+            artist (str): Geschriebener Künstler
+            title (str): Geschriebener Titel
+            album (str): Geschriebenes Album (optional)
+            path (str): Pfad der geschriebenen Datei (optional, für lookup_confirmed_file)
+            stat_key (tuple): (mtime_ns, size) der Datei nach dem Schreiben
+        """
+        with self._lock, self._conn:
+            if path and stat_key:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO confirmed_files VALUES (?, ?, ?, ?)', (path, *stat_key, fp_hash)
+                )
+            self._conn.execute(
+                'INSERT INTO fingerprints (fp_hash, service, artist, title, album, confidence, user_confirmed) '
+                "VALUES (?, 'Lokal', ?, ?, ?, 1.0, 1) "
+                'ON CONFLICT(fp_hash) DO UPDATE SET artist = excluded.artist, title = excluded.title, '
+                'album = COALESCE(excluded.album, album), user_confirmed = 1',
+                (fp_hash, artist, title, album or None)
+            )
+
+
+@lru_cache(maxsize=1)
+def get_recognition_cache():
+    """
+    Liefert den prozessweit gemeinsamen RecognitionCache oder None
+
+    Pfad über MP3_RECOGNITION_CACHE_DB (Standard: ~/.mp3tagger/recognition_cache.db),
+    ein leerer Wert schaltet den Cache ab.
+    """
+    db_path = os.getenv('MP3_RECOGNITION_CACHE_DB', os.path.join('~', '.mp3tagger', 'recognition_cache.db'))
+    if not db_path:
+        return None
+
+    try:
+        return RecognitionCache(os.path.expanduser(db_path))
+    except (OSError, sqlite3.Error) as e:
+        logging.warning(f"Erkennungs-Cache nicht verfügbar ({db_path}): {str(e)}")
+        return None
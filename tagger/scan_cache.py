@@ -0,0 +1,131 @@
+"""
+Scan Cache Module
+Persistenter SQLite-Cache für die beim Verzeichnisscan gelesenen ID3-Datensätze
+"""
+
+import os
+import logging
+import pickle
+import sqlite3
+import threading
+from functools import lru_cache
+
+
+class ScanCache:
+    """
+    Speichert pro MP3-Datei den gelesenen Datensatz zusammen mit mtime und Größe
+
+    Ein Eintrag gilt nur, solange mtime und Größe der Datei übereinstimmen -
+    jede Änderung an der Datei (z.B. Tag-Update) führt zum erneuten Lesen.
+    Dadurch entfällt nach einem Neustart das ID3-Parsing unveränderter Dateien.
+    """
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        # WAL: Lesen während laufender Scans, NORMAL: schnelle Commits
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, record BLOB NOT NULL)'
+        )
+        self._conn.commit()
+
+    def lookup(self, directory, stats):
+        """
+        Liefert die gültigen Datensätze unterhalb eines Verzeichnisses
+
+        Args:
+            directory (str): Gescanntes Verzeichnis
+            stats (dict): Pfad -> (mtime_ns, size) der aktuell vorhandenen Dateien
+
+        Returns:
+            dict: Pfad -> Datensatz für alle unveränderten Dateien
+        """
+        records = {}
+        for path, mtime_ns, size, record in self._rows_below(directory, 'path, mtime_ns, size, record'):
+            if stats.get(path) == (mtime_ns, size):
+                try:
+                    records[path] = pickle.loads(record)
+                except Exception as e:
+                    logging.warning(f"Ungültiger Cache-Eintrag für {path}: {str(e)}")
+        return records
+
+    def store(self, directory, stats, records):
+        """
+        Speichert neu gelesene Datensätze und entfernt Einträge gelöschter Dateien
+
+        Args:
+            directory (str): Gescanntes Verzeichnis
+            stats (dict): Pfad -> (mtime_ns, size) aller aktuell vorhandenen Dateien
+            records (dict): Pfad -> Datensatz der neu gelesenen Dateien
+        """
+        rows = [
+            (path, *stats[path], pickle.dumps(record, pickle.HIGHEST_PROTOCOL))
+            for path, record in records.items()
+        ]
+        stale = [(path,) for (path,) in self._rows_below(directory, 'path') if path not in stats]
+
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)', rows)
+            self._conn.executemany('DELETE FROM files WHERE path = ?', stale)
+
+    def lookup_file(self, path, stat_key):
+        """
+        Liefert den Datensatz einer einzelnen Datei, falls mtime und Größe übereinstimmen
+
+        Args:
+            path (str): Pfad der MP3-Datei
+            stat_key (tuple): (mtime_ns, size) der Datei
+
+        Returns:
+            dict: Datensatz oder None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT record FROM files WHERE path = ? AND mtime_ns = ? AND size = ?', (path, *stat_key)
+            ).fetchone()
+        if row:
+            try:
+                return pickle.loads(row[0])
+            except Exception as e:
+                logging.warning(f"Ungültiger Cache-Eintrag für {path}: {str(e)}")
+        return None
+
+    def store_file(self, path, stat_key, record):
+        """Speichert den Datensatz einer einzelnen Datei (ohne Aufräumen des Verzeichnisses)"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                (path, *stat_key, pickle.dumps(record, pickle.HIGHEST_PROTOCOL))
+            )
+
+    def _rows_below(self, directory, columns):
+        """Alle Zeilen mit Pfad unterhalb von directory (Bereichsabfrage über den Primärschlüssel)"""
+        prefix = os.path.join(directory, '')
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        with self._lock:
+            return self._conn.execute(
+                f'SELECT {columns} FROM files WHERE path >= ? AND path < ?', (prefix, upper)
+            ).fetchall()
+
+
+@lru_cache(maxsize=1)
+def get_scan_cache():
+    """
+    Liefert den prozessweit gemeinsamen ScanCache oder None
+
+    Pfad über MP3_SCAN_CACHE_DB (Standard: ~/.mp3tagger/scan_cache.db),
+    ein leerer Wert schaltet den Cache ab.
+    """
+    db_path = os.getenv('MP3_SCAN_CACHE_DB', os.path.join('~', '.mp3tagger', 'scan_cache.db'))
+    if not db_path:
+        return None
+
+    try:
+        return ScanCache(os.path.expanduser(db_path))
+    except (OSError, sqlite3.Error) as e:
+        logging.warning(f"Scan-Cache nicht verfügbar ({db_path}): {str(e)}")
+        return None
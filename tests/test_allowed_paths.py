@@ -0,0 +1,40 @@
+"""
+Tests für die Prüfung gegen MP3_ALLOWED_ROOTS
+"""
+
+import os
+
+import app
+
+
+def test_repointed_symlink_loses_access(tmp_path, monkeypatch):
+    music = tmp_path / 'music'
+    outside = tmp_path / 'outside'
+    (music / 'album').mkdir(parents=True)
+    outside.mkdir()
+    (music / 'album' / 'track.mp3').write_bytes(b'')
+    (outside / 'track.mp3').write_bytes(b'')
+    monkeypatch.setattr(app, 'ALLOWED_ROOTS', (os.path.realpath(music),))
+
+    link = music / 'link'
+    link.symlink_to(music / 'album')
+    assert app._resolve_directory(str(link)) == os.path.realpath(music / 'album')
+    assert app._resolve_audio_path(f'{link}/track.mp3') is not None
+    assert app._is_allowed_path(f'{link}/track.mp3')
+
+    # Symlink zeigt jetzt aus der Musik-Wurzel heraus - die frühere Freigabe gilt nicht mehr
+    link.unlink()
+    link.symlink_to(outside)
+    assert app._resolve_directory(str(link)) is None
+    assert app._resolve_audio_path(f'{link}/track.mp3') is None
+    assert not app._is_allowed_path(f'{link}/track.mp3')
+
+
+def test_parent_segments_stay_inside_roots(tmp_path, monkeypatch):
+    music = tmp_path / 'music'
+    music.mkdir()
+    monkeypatch.setattr(app, 'ALLOWED_ROOTS', (os.path.realpath(music),))
+
+    assert app._resolve_directory(f'{music}/../') is None
+    assert app._resolve_directory(f'{music}-other') is None
+    assert app._resolve_directory(str(music)) == os.path.realpath(music)
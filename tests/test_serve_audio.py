@@ -0,0 +1,81 @@
+"""
+Tests für /static/audio - Auslieferung der MP3-Dateien an den Player
+"""
+
+import pytest
+
+from app import app
+
+# MPEG-1 Layer III, 128 kbit/s, 44,1 kHz: 417 Byte pro Frame
+MP3_FRAME = b'\xff\xfb\x90\x00' + b'\x00' * 413
+MP3_SIZE = 200000
+
+
+@pytest.fixture
+def mp3_file(tmp_path):
+    """Eine echte (stille) MP3-Datei aus gültigen MPEG-Frames"""
+    data = (MP3_FRAME * (MP3_SIZE // len(MP3_FRAME) + 1))[:MP3_SIZE]
+    path = tmp_path / 'track.mp3'
+    path.write_bytes(data)
+    return path, data
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def test_serve_audio_full_file(client, mp3_file):
+    path, data = mp3_file
+    response = client.get(f'/static/audio{path}')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'audio/mpeg'
+    assert response.get_data() == data
+
+
+def test_serve_audio_range(client, mp3_file):
+    path, data = mp3_file
+    response = client.get(f'/static/audio{path}', headers={'Range': 'bytes=0-99'})
+
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 0-99/{MP3_SIZE}'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.get_data() == data[:100]
+
+
+def test_serve_audio_seek_and_revalidate(client, mp3_file):
+    path, data = mp3_file
+    first = client.get(f'/static/audio{path}')
+    etag = first.headers['ETag']
+    assert first.headers['Last-Modified']
+
+    # Springen mitten in den Track: offener Range bis zum Dateiende
+    response = client.get(f'/static/audio{path}', headers={'Range': 'bytes=150000-'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 150000-{MP3_SIZE - 1}/{MP3_SIZE}'
+    assert response.get_data() == data[150000:]
+
+    # Erneutes Abspielen einer unveränderten Datei
+    response = client.get(f'/static/audio{path}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+
+    response = client.get(f'/static/audio{path}', headers={'If-Modified-Since': first.headers['Last-Modified']})
+    assert response.status_code == 304
+
+
+def test_serve_audio_if_range(client, mp3_file):
+    path, data = mp3_file
+    etag = client.get(f'/static/audio{path}').headers['ETag']
+
+    # Unveränderte Datei: der Browser setzt den Download ab der Unterbrechung fort
+    response = client.get(f'/static/audio{path}', headers={'Range': 'bytes=100-199', 'If-Range': etag})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 100-199/{MP3_SIZE}'
+    assert response.get_data() == data[100:200]
+
+    # Veraltetes ETag (Datei inzwischen neu getaggt): komplette Datei statt Bruchstück
+    response = client.get(f'/static/audio{path}', headers={'Range': 'bytes=100-199', 'If-Range': '"veraltet"'})
+    assert response.status_code == 200
+    assert response.get_data() == data